@@ -1,4 +1,63 @@
-from django.contrib import admin  # noqa
+from django.contrib import admin
 
+from .models import (
+    Background, Campaign, Character, DnDClass, Encounter, Race,
+    ResourceEvent, Spell, Weapon,
+)
 
-# Register your models here.
+
+class CharacterInline(admin.TabularInline):
+    model = Character
+    fields = ['player', 'level', 'initiative', 'current_hit_points']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = True
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('player')
+
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['name', 'dungeon_master']
+    list_select_related = ['dungeon_master']
+    inlines = [CharacterInline]
+
+
+@admin.register(Character)
+class CharacterAdmin(admin.ModelAdmin):
+    list_display = ['id', 'player', 'campaign', 'level', 'initiative']
+    list_filter = ['campaign']
+    readonly_fields = Character.STAT_FIELDS
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_sheet()
+
+
+@admin.register(Encounter)
+class EncounterAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'campaign', 'round', 'ended', 'created']
+    list_filter = ['ended']
+    list_select_related = ['campaign']
+
+
+@admin.register(ResourceEvent)
+class ResourceEventAdmin(admin.ModelAdmin):
+    list_display = ['created', 'character', 'resource', 'delta', 'user', 'applied']
+    list_filter = ['resource', 'applied']
+    list_select_related = ['character__player', 'user']
+    raw_id_fields = ['character', 'user', 'reverts']
+
+    # The event log is append-only
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Race, DnDClass, Background, Weapon, Spell)
+class ReferenceAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
@@ -0,0 +1,240 @@
+"""Initiative tracking
+
+InitiativeTracker keeps the turn order of an encounter. Combatants act in
+order of initiative, then dexterity modifier, then the order they joined in.
+
+Rather than re-sorting everyone on each change, the combatants still to act
+this round are kept in one heap and those who have acted in another, which
+becomes the next round. Removing a combatant only forgets their entry; stale
+heap entries are skipped when they surface. Inserting, removing, delaying
+and advancing the turn are all O(log n).
+
+The state saved on an Encounter is a compact list of rows, so loading and
+saving a tracker is a single heapify rather than a sort.
+"""
+
+import heapq
+
+
+class CombatError(ValueError):
+    pass
+
+
+class Combatant:
+    """
+    A character or monster taking part in an encounter. ``key`` identifies
+    it within the encounter, e.g. "character:12" or "monster:goblin-2".
+    """
+
+    def __init__(self, key, name, initiative, dex_mod=0):
+        self.key = key
+        self.name = name
+        self.initiative = initiative
+        self.dex_mod = dex_mod
+
+    def __repr__(self):
+        return f'<Combatant: {self.name}>'
+
+    @classmethod
+    def from_character(cls, character):
+        return cls(
+            key=f'character:{character.pk}',
+            name=str(character.player),
+            initiative=character.initiative,
+            dex_mod=character.dex_mod,
+        )
+
+
+class InitiativeTracker:
+
+    def __init__(self, round=1):
+        self.round = round
+        self.active = None
+        self.combatants = {}
+        # Readied actions, keyed on combatant
+        self.readied = {}
+        # Heap entries, [initiative, dex_mod, sequence, key] with the first
+        # two negated so the heaps pop the highest first. An entry stays
+        # valid while it is the one recorded in ``entries``.
+        self.entries = {}
+        self.current = []
+        self.upcoming = []
+        self.sequence = 0
+
+    def __len__(self):
+        return len(self.combatants)
+
+    def __contains__(self, key):
+        return key in self.combatants
+
+    def make_entry(self, combatant):
+        self.sequence += 1
+        entry = [-combatant.initiative, -combatant.dex_mod, self.sequence, combatant.key]
+        self.entries[combatant.key] = entry
+        return entry
+
+    def acts_later(self, entry):
+        """
+        Whether ``entry`` comes after the active combatant this round.
+        """
+        if self.active is None:
+            return True
+        active = self.combatants[self.active]
+        return entry[:2] > [-active.initiative, -active.dex_mod]
+
+    def insert(self, combatant):
+        """
+        Adds ``combatant``. If their initiative comes after the active
+        combatant's they act this round, otherwise from the next one.
+        """
+        if combatant.key in self.combatants:
+            raise CombatError(f'{combatant.name} is already in the encounter')
+        self.combatants[combatant.key] = combatant
+        entry = self.make_entry(combatant)
+        heapq.heappush(self.current if self.acts_later(entry) else self.upcoming, entry)
+
+    def remove(self, key):
+        """
+        Removes a combatant, e.g. one that died or fled. Removing the active
+        combatant ends their turn.
+        """
+        if key not in self.combatants:
+            raise CombatError(f'{key} is not in the encounter')
+        del self.combatants[key]
+        self.entries.pop(key, None)
+        self.readied.pop(key, None)
+        if self.active == key:
+            self.active = None
+
+    def pop(self, heap):
+        while heap:
+            entry = heapq.heappop(heap)
+            if self.entries.get(entry[3]) is entry:
+                return entry
+        return None
+
+    def peek(self, heap):
+        while heap and self.entries.get(heap[0][3]) is not heap[0]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def advance(self):
+        """
+        Ends the active combatant's turn and returns the next combatant, or
+        None once nobody is left.
+        """
+        if self.active is not None:
+            combatant = self.combatants[self.active]
+            heapq.heappush(self.upcoming, self.make_entry(combatant))
+            self.active = None
+
+        entry = self.pop(self.current)
+        if entry is None:
+            if self.peek(self.upcoming) is None:
+                return None
+            self.round += 1
+            self.current, self.upcoming = self.upcoming, []
+            entry = self.pop(self.current)
+
+        self.active = entry[3]
+        # A readied action lasts until the combatant's next turn
+        self.readied.pop(self.active, None)
+        return self.combatants[self.active]
+
+    def delay(self, initiative):
+        """
+        The active combatant delays their turn to ``initiative``, which
+        becomes their initiative from then on. Returns the next combatant.
+        """
+        if self.active is None:
+            raise CombatError('Nobody is taking a turn')
+        combatant = self.combatants[self.active]
+        if initiative > combatant.initiative:
+            raise CombatError('A turn can only be delayed to a lower initiative')
+
+        combatant.initiative = initiative
+        heapq.heappush(self.current, self.make_entry(combatant))
+        self.active = None
+        return self.advance()
+
+    def ready(self, trigger):
+        """
+        The active combatant readies an action for ``trigger`` and ends their
+        turn. Returns the next combatant.
+        """
+        if self.active is None:
+            raise CombatError('Nobody is taking a turn')
+        self.readied[self.active] = trigger
+        return self.advance()
+
+    def trigger(self, key):
+        """
+        Uses a combatant's readied action, returning the trigger it was
+        readied for. The turn order doesn't change.
+        """
+        try:
+            return self.readied.pop(key)
+        except KeyError:
+            raise CombatError(f'{key} has no readied action')
+
+    def order(self):
+        """
+        Returns the combatants in turn order, starting with the active one
+        and wrapping round to those who have already acted.
+        """
+        current = sorted(e for e in self.current if self.entries.get(e[3]) is e)
+        upcoming = sorted(e for e in self.upcoming if self.entries.get(e[3]) is e)
+        keys = [e[3] for e in current + upcoming]
+        if self.active is not None:
+            keys.insert(0, self.active)
+        return [self.combatants[key] for key in keys]
+
+    def to_state(self):
+        """
+        Returns the tracker as a JSON serializable dict.
+        """
+        # Rows are [key, name, initiative, dex_mod, sequence, acted], with
+        # ``acted`` None for the active combatant
+        rows = []
+        if self.active is not None:
+            combatant = self.combatants[self.active]
+            rows.append([
+                combatant.key, combatant.name, combatant.initiative,
+                combatant.dex_mod, 0, None,
+            ])
+        for heap, acted in ((self.current, False), (self.upcoming, True)):
+            for entry in heap:
+                key = entry[3]
+                if self.entries.get(key) is not entry:
+                    continue
+                combatant = self.combatants[key]
+                rows.append([
+                    key, combatant.name, combatant.initiative,
+                    combatant.dex_mod, entry[2], acted,
+                ])
+        return {
+            'round': self.round,
+            'sequence': self.sequence,
+            'combatants': rows,
+            'readied': self.readied,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        tracker = cls(round=state.get('round', 1))
+        tracker.sequence = state.get('sequence', 0)
+        tracker.readied = dict(state.get('readied', {}))
+
+        for key, name, initiative, dex_mod, sequence, acted in state.get('combatants', []):
+            combatant = Combatant(key, name, initiative, dex_mod)
+            tracker.combatants[key] = combatant
+            if acted is None:
+                tracker.active = key
+                continue
+            entry = [-initiative, -dex_mod, sequence, key]
+            tracker.entries[key] = entry
+            (tracker.upcoming if acted else tracker.current).append(entry)
+
+        heapq.heapify(tracker.current)
+        heapq.heapify(tracker.upcoming)
+        return tracker
@@ -0,0 +1,272 @@
+"""Websocket combat channel
+
+Each campaign has a combat channel at /ws/campaigns/<id>/combat/ (routed in
+project.asgi). Its dungeon master and players can connect with their normal
+login session. On connect a client receives the party in initiative order,
+then every event published to the campaign (see dnd.pubsub):
+
+    {"type": "party", "characters": [{"id": ..., "name": ...,
+     "initiative": ..., "current_hit_points": ..., "hit_points_max": ...}]}
+    {"type": "hp", "character": <id>, "current_hit_points": ..., "delta": ...}
+    {"type": "turn", "advanced_by": <user id>, "round": ...,
+     "active": <combatant key>, "order": [<combatant key>, ...]}
+
+The dungeon master can also send events. Turn events update the campaign's
+encounter in progress, see dnd.combat:
+
+    {"type": "turn.advance"}
+    {"type": "turn.delay", "initiative": <int>}
+    {"type": "turn.ready", "trigger": <text>}
+    {"type": "hp.delta", "character": <id>, "delta": <int>}
+    {"type": "undo", "event": <resource event id>}
+"""
+
+import asyncio
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import (
+    HASH_SESSION_KEY, SESSION_KEY, get_user_model,
+)
+from django.http.cookie import parse_cookie
+from django.db import transaction
+from django.http.request import split_domain_port, validate_host
+from django.utils.crypto import constant_time_compare
+
+from . import resources
+from .models import Campaign, Character, Encounter, ResourceEvent
+from .pubsub import combat_channel, get_broker, publish_combat_event
+
+# Websocket close codes, in the range reserved for applications
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def get_headers(scope):
+    return {
+        name.decode('latin1').lower(): value.decode('latin1')
+        for name, value in scope.get('headers', [])
+    }
+
+
+def origin_allowed(headers):
+    """
+    Browsers send websockets cross-site with cookies attached, so reject
+    origins other than our own hosts.
+    """
+    origin = headers.get('origin')
+    if origin is None:
+        return True
+    host = origin.split('://', 1)[-1]
+    domain, _ = split_domain_port(host)
+    allowed = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed:
+        allowed = ['.localhost', '127.0.0.1', '[::1]']
+    return bool(domain) and validate_host(domain, allowed)
+
+
+@sync_to_async
+def get_user(headers):
+    """
+    Returns the user logged in with the session cookie, if any.
+    """
+    cookies = parse_cookie(headers.get('cookie', ''))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+
+    engine = import_module(settings.SESSION_ENGINE)
+    session = engine.SessionStore(session_key)
+    user_id = session.get(SESSION_KEY)
+    if user_id is None:
+        return None
+
+    User = get_user_model()
+    try:
+        user = User._default_manager.get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+
+    if not constant_time_compare(
+        session.get(HASH_SESSION_KEY, ''), user.get_session_auth_hash(),
+    ):
+        return None
+    return user
+
+
+@sync_to_async
+def get_campaign(campaign_id):
+    return Campaign.objects.filter(pk=campaign_id).first()
+
+
+@sync_to_async
+def is_player(user, campaign):
+    return campaign.characters.filter(player=user).exists()
+
+
+@sync_to_async
+def get_party(campaign):
+    characters = list(
+        campaign.characters.select_related('player').in_initiative_order()
+    )
+    resources.load_current(characters)
+    return [
+        {
+            'id': character.pk,
+            'name': str(character.player),
+            'initiative': character.initiative,
+            'current_hit_points': character.current_hit_points,
+            'hit_points_max': character.hit_points_max,
+        }
+        for character in characters
+    ]
+
+
+@sync_to_async
+def apply_hit_point_delta(campaign, user, character_id, delta):
+    # Recording publishes the resulting "hp" event
+    character = Character.objects.get(campaign=campaign, pk=character_id)
+    resources.record(character, 'hit_points', delta, user=user)
+
+
+@sync_to_async
+def undo_resource_event(campaign, user, event_id):
+    event = ResourceEvent.objects.select_related('character').get(
+        character__campaign=campaign, pk=event_id,
+    )
+    resources.undo(event, user=user)
+
+
+@sync_to_async
+@transaction.atomic
+def take_turn(campaign, action, *args):
+    """
+    Applies a turn ``action`` (advance, delay or ready) to the campaign's
+    encounter in progress, starting one with the party if there is none.
+    Returns the resulting turn order.
+    """
+    encounter = (
+        Encounter.objects.select_for_update()
+        .filter(campaign=campaign).in_progress().last()
+    )
+    if encounter is None:
+        encounter = Encounter.objects.create(campaign=campaign)
+
+    tracker = encounter.get_tracker()
+    getattr(tracker, action)(*args)
+    encounter.save_tracker(tracker)
+    return {
+        'round': tracker.round,
+        'active': tracker.active,
+        'order': [combatant.key for combatant in tracker.order()],
+    }
+
+
+class CombatConsumer:
+    """
+    Handles a single websocket connection to a campaign's combat channel.
+    """
+
+    def __init__(self, scope, receive, send, campaign_id):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.campaign_id = campaign_id
+
+    async def send_json(self, message):
+        await self.send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def close(self, code=1000):
+        await self.send({'type': 'websocket.close', 'code': code})
+
+    async def __call__(self):
+        message = await self.receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        headers = get_headers(self.scope)
+        campaign = await get_campaign(self.campaign_id)
+        if campaign is None:
+            return await self.close(CLOSE_NOT_FOUND)
+
+        user = await get_user(headers) if origin_allowed(headers) else None
+        if user is None:
+            return await self.close(CLOSE_FORBIDDEN)
+        self.is_dungeon_master = campaign.dungeon_master_id == user.pk
+        if not self.is_dungeon_master and not await is_player(user, campaign):
+            return await self.close(CLOSE_FORBIDDEN)
+
+        self.campaign = campaign
+        self.user = user
+
+        subscription = get_broker().subscribe(combat_channel(campaign.pk))
+        try:
+            await self.send({'type': 'websocket.accept'})
+            await self.send_json({
+                'type': 'party', 'characters': await get_party(campaign),
+            })
+            forward = asyncio.ensure_future(self.forward(subscription))
+            try:
+                await self.listen()
+            finally:
+                forward.cancel()
+        finally:
+            subscription.close()
+
+    async def forward(self, subscription):
+        async for event in subscription:
+            await self.send_json(event)
+
+    async def listen(self):
+        while True:
+            message = await self.receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            if message['type'] != 'websocket.receive':
+                continue
+
+            try:
+                event = json.loads(message.get('text') or '')
+            except ValueError:
+                continue
+            if isinstance(event, dict) and self.is_dungeon_master:
+                await self.handle_event(event)
+
+    async def handle_event(self, event):
+        if event.get('type') in ('turn.advance', 'turn.delay', 'turn.ready'):
+            try:
+                args = self.get_turn_args(event)
+                turn = await take_turn(self.campaign, *args)
+            except (KeyError, TypeError, ValueError):
+                # Including CombatError, e.g. nobody is taking a turn
+                return
+            publish_combat_event(self.campaign.pk, {
+                'type': 'turn', 'advanced_by': self.user.pk, **turn,
+            })
+        elif event.get('type') == 'hp.delta':
+            try:
+                character_id = int(event['character'])
+                delta = int(event['delta'])
+            except (KeyError, TypeError, ValueError):
+                return
+            try:
+                await apply_hit_point_delta(
+                    self.campaign, self.user, character_id, delta,
+                )
+            except Character.DoesNotExist:
+                pass
+        elif event.get('type') == 'undo':
+            try:
+                await undo_resource_event(self.campaign, self.user, int(event['event']))
+            except (KeyError, TypeError, ValueError, ResourceEvent.DoesNotExist):
+                # Including an event that was already undone
+                pass
+
+    def get_turn_args(self, event):
+        if event['type'] == 'turn.delay':
+            return 'delay', int(event['initiative'])
+        if event['type'] == 'turn.ready':
+            return 'ready', str(event['trigger'])
+        return 'advance',
@@ -0,0 +1,345 @@
+"""Dice expressions
+
+Dice strings such as "3d8" (hit dice), "2d6+1d4+3" (damage) or "4d6dl1"
+(ability score generation) are parsed once by parse() into a DiceExpression,
+which is cached per expression string. A DiceExpression rolls in bulk: asking
+for 10,000 rolls draws all of the dice with a single call to the NumPy random
+generator instead of looping in Python.
+
+Supported syntax, case and whitespace insensitive:
+
+    NdM     roll N dice with M sides (N defaults to 1, "d%" is a d100)
+    NdMkhK  keep the highest K dice ("2d20kh1" is advantage, "k" alone
+            means "kh")
+    NdMklK  keep the lowest K dice ("2d20kl1" is disadvantage)
+    NdMdlK  drop the lowest K dice ("4d6dl1")
+    NdMdhK  drop the highest K dice
+    C       a constant
+
+Terms are joined with "+" or "-". Pass ``seed`` or a generator from
+get_rng() to get repeatable rolls, e.g. in tests.
+
+DiceExpression.distribution() gives the exact outcome distribution of an
+expression, built by convolving the distributions of its dice. It is
+computed once per expression, so repeated "chance to hit" lookups are free.
+"""
+
+import re
+from functools import lru_cache
+
+import numpy as np
+
+ADVANTAGE = '2d20kh1'
+DISADVANTAGE = '2d20kl1'
+
+# Guards against expressions that would allocate enormous arrays
+MAX_DICE = 1000
+
+# Largest number of outcomes enumerated when computing the exact
+# distribution of a keep/drop term, e.g. 6**6 for "6d6kh3"
+MAX_ENUMERATED_OUTCOMES = 6 ** 7
+
+TERM = re.compile(
+    r'(?P<sign>[+-])?'
+    r'(?:'
+    r'(?P<count>\d*)d(?P<sides>\d+|%)'
+    r'(?:(?P<op>kh|kl|k|dh|dl)(?P<n>\d+))?'
+    r'|(?P<constant>\d+)'
+    r')'
+)
+
+
+class DiceError(ValueError):
+    pass
+
+
+def get_rng(seed=None):
+    """
+    Returns a NumPy random generator. Pass a seed for repeatable rolls.
+    """
+    return np.random.default_rng(seed)
+
+
+class Distribution:
+    """
+    An exact probability distribution over consecutive integer outcomes,
+    starting at ``minimum``.
+    """
+
+    def __init__(self, minimum, pmf):
+        self.minimum = minimum
+        self.pmf = np.asarray(pmf, dtype=np.float64)
+
+    def __repr__(self):
+        return f'<Distribution: {self.minimum}..{self.maximum}>'
+
+    @classmethod
+    def constant(cls, value):
+        return cls(value, [1.0])
+
+    @classmethod
+    def die(cls, sides):
+        return cls(1, np.full(sides, 1 / sides))
+
+    @property
+    def maximum(self):
+        return self.minimum + len(self.pmf) - 1
+
+    @property
+    def values(self):
+        return np.arange(self.minimum, self.maximum + 1)
+
+    @property
+    def cdf(self):
+        return np.cumsum(self.pmf)
+
+    @property
+    def mean(self):
+        return float(self.values @ self.pmf)
+
+    def probability(self, value):
+        """P(roll == value)"""
+        index = value - self.minimum
+        if 0 <= index < len(self.pmf):
+            return float(self.pmf[index])
+        return 0.0
+
+    def at_least(self, value):
+        """P(roll >= value), e.g. the chance to meet a DC or armor class."""
+        index = max(value - self.minimum, 0)
+        return float(self.pmf[index:].sum())
+
+    def at_most(self, value):
+        """P(roll <= value)"""
+        return 1.0 - self.at_least(value + 1)
+
+    def clip(self, low):
+        """
+        Returns the distribution of ``max(roll, low)``, e.g. for rules such
+        as "you gain at least 1 hit point".
+        """
+        if low <= self.minimum:
+            return self
+        if low > self.maximum:
+            return Distribution.constant(low)
+        index = low - self.minimum
+        pmf = self.pmf[index:].copy()
+        pmf[0] += self.pmf[:index].sum()
+        return Distribution(low, pmf)
+
+    def __add__(self, other):
+        return Distribution(
+            self.minimum + other.minimum, np.convolve(self.pmf, other.pmf),
+        )
+
+    def __neg__(self):
+        return Distribution(-self.maximum, self.pmf[::-1])
+
+    def __mul__(self, count):
+        """The sum of ``count`` independent rolls of this distribution."""
+        result = Distribution.constant(0)
+        base = self
+        # Exponentiation by squaring keeps the number of convolutions small
+        while count:
+            if count & 1:
+                result = result + base
+            count >>= 1
+            if count:
+                base = base + base
+        return result
+
+
+class DiceTerm:
+    """
+    A group of identical dice, of which the ``keep`` highest (or lowest) are
+    added to the total.
+    """
+
+    def __init__(self, count, sides, keep=None, keep_highest=True, sign=1):
+        if count < 1 or sides < 1:
+            raise DiceError('Dice need a positive count and number of sides')
+        if count > MAX_DICE:
+            raise DiceError(f'Cannot roll more than {MAX_DICE} dice at once')
+        keep = count if keep is None else keep
+        if not 0 < keep <= count:
+            raise DiceError(f'Cannot keep {keep} of {count} dice')
+
+        self.count = count
+        self.sides = sides
+        self.keep = keep
+        self.keep_highest = keep_highest
+        self.sign = sign
+
+    def __str__(self):
+        text = f'{self.count}d{self.sides}'
+        if self.keep != self.count:
+            text += f"{'kh' if self.keep_highest else 'kl'}{self.keep}"
+        return text
+
+    def roll(self, rng, size):
+        """
+        Rolls this term ``size`` times, returning an array of totals.
+        """
+        dice = rng.integers(1, self.sides + 1, size=(size, self.count))
+        if self.keep != self.count:
+            dice.sort(axis=1)
+            if self.keep_highest:
+                dice = dice[:, self.count - self.keep:]
+            else:
+                dice = dice[:, :self.keep]
+        return self.sign * dice.sum(axis=1)
+
+    def distribution(self):
+        """
+        Returns the exact Distribution of this term's total.
+        """
+        if self.keep == self.count:
+            result = Distribution.die(self.sides) * self.count
+        elif self.keep == 1:
+            # The highest (or lowest) of N dice has a closed form:
+            # P(highest <= x) = (x / sides) ** N
+            cdf = (np.arange(self.sides + 1) / self.sides) ** self.count
+            pmf = np.diff(cdf)
+            result = Distribution(1, pmf if self.keep_highest else pmf[::-1])
+        else:
+            result = self._enumerated_distribution()
+        return -result if self.sign < 0 else result
+
+    def _enumerated_distribution(self):
+        if self.sides ** self.count > MAX_ENUMERATED_OUTCOMES:
+            raise DiceError(
+                f'Too many dice to compute an exact distribution for {self}'
+            )
+        dice = np.indices((self.sides,) * self.count).reshape(self.count, -1)
+        dice = np.sort(dice.T + 1, axis=1)
+        if self.keep_highest:
+            dice = dice[:, self.count - self.keep:]
+        else:
+            dice = dice[:, :self.keep]
+        totals = dice.sum(axis=1)
+        counts = np.bincount(totals - self.keep)
+        return Distribution(self.keep, counts / counts.sum())
+
+
+class DiceExpression:
+    """
+    A compiled dice expression. Get these from parse(), which caches them,
+    rather than building them directly.
+    """
+
+    def __init__(self, terms, constant=0):
+        self.terms = tuple(terms)
+        self.constant = constant
+        self._distribution = None
+
+    def __str__(self):
+        text = ''
+        for term in self.terms:
+            text += ('-' if term.sign < 0 else '+') + str(term)
+        if self.constant:
+            text += f'{self.constant:+d}'
+        return text.lstrip('+') or '0'
+
+    def __repr__(self):
+        return f'<DiceExpression: {self}>'
+
+    @property
+    def minimum(self):
+        return self.constant + sum(
+            term.keep if term.sign > 0 else -term.keep * term.sides
+            for term in self.terms
+        )
+
+    @property
+    def maximum(self):
+        return self.constant + sum(
+            term.keep * term.sides if term.sign > 0 else -term.keep
+            for term in self.terms
+        )
+
+    def distribution(self):
+        """
+        Returns the exact Distribution of the expression's total. Computed
+        once and then reused.
+        """
+        if self._distribution is None:
+            result = Distribution.constant(self.constant)
+            for term in self.terms:
+                result = result + term.distribution()
+            self._distribution = result
+        return self._distribution
+
+    def roll(self, size=None, rng=None, seed=None):
+        """
+        Rolls the expression. Returns a single int, or an array of ``size``
+        independent rolls.
+        """
+        if rng is None:
+            rng = get_rng(seed)
+        elif seed is not None:
+            raise TypeError('Pass either rng or seed, not both')
+
+        count = 1 if size is None else size
+        totals = np.full(count, self.constant, dtype=np.int64)
+        for term in self.terms:
+            totals += term.roll(rng, count)
+
+        if size is None:
+            return int(totals[0])
+        return totals
+
+
+@lru_cache(maxsize=1024)
+def parse(expression):
+    """
+    Parses a dice expression string into a DiceExpression. Raises DiceError
+    if the expression is invalid.
+    """
+    text = str(expression)
+    if re.search(r'\d\s+\d', text):
+        raise DiceError(f'Invalid dice expression: {expression!r}')
+    text = re.sub(r'\s+', '', text).lower()
+    if not text:
+        raise DiceError('Empty dice expression')
+
+    terms = []
+    constant = 0
+    position = 0
+    while position < len(text):
+        match = TERM.match(text, position)
+        if not match or match.end() == position:
+            raise DiceError(f'Invalid dice expression: {expression!r}')
+        if position and not match.group('sign'):
+            raise DiceError(f'Invalid dice expression: {expression!r}')
+        position = match.end()
+
+        sign = -1 if match.group('sign') == '-' else 1
+        if match.group('constant') is not None:
+            constant += sign * int(match.group('constant'))
+            continue
+
+        count = int(match.group('count') or 1)
+        sides = match.group('sides')
+        sides = 100 if sides == '%' else int(sides)
+
+        op, n = match.group('op'), match.group('n')
+        keep, keep_highest = count, True
+        if op in ('k', 'kh'):
+            keep = int(n)
+        elif op == 'kl':
+            keep, keep_highest = int(n), False
+        elif op == 'dl':
+            keep = count - int(n)
+        elif op == 'dh':
+            keep, keep_highest = count - int(n), False
+
+        terms.append(DiceTerm(count, sides, keep, keep_highest, sign))
+
+    return DiceExpression(terms, constant)
+
+
+def roll(expression, size=None, rng=None, seed=None):
+    """
+    Shortcut for ``parse(expression).roll(...)``.
+    """
+    return parse(expression).roll(size=size, rng=rng, seed=seed)
@@ -0,0 +1,71 @@
+import random
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand
+
+from dnd import stats
+from dnd.models import ABILITIES, SKILLS, Character
+
+
+class Command(BaseCommand):
+    help = 'Compare per-character stat computation against the batch engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n', '--count', type=int, default=10000,
+            help='Number of characters to compute stats for.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed for generating the characters.',
+        )
+
+    def make_characters(self, count, seed):
+        # Unsaved characters are enough here; nothing touches the database
+        rng = random.Random(seed)
+        skills = [skill for skill, _ in SKILLS]
+        characters = []
+        for pk in range(1, count + 1):
+            proficient = rng.sample(skills, 4)
+            scores = {
+                f'{ability}_score': rng.randint(3, 20)
+                for ability, _ in ABILITIES
+            }
+            characters.append(Character(
+                pk=pk,
+                exp_points=rng.randint(0, 400000),
+                skill_prof=proficient,
+                skill_expert=proficient[:rng.randint(0, 2)],
+                **scores
+            ))
+        return characters
+
+    def time(self, func):
+        start = default_timer()
+        result = func()
+        return default_timer() - start, result
+
+    def handle(self, *args, **options):
+        characters = self.make_characters(options['count'], options['seed'])
+
+        def per_instance():
+            for character in characters:
+                character.update_stats()
+                for skill, _ in SKILLS:
+                    character.skill_mod(skill)
+
+        instance_time, _ = self.time(per_instance)
+        batch_time, batch = self.time(lambda: stats.compute(characters))
+
+        # Sanity check that both paths agree
+        for character in characters[:100]:
+            expected = batch.for_character(character.pk)
+            for field, value in expected.items():
+                assert getattr(character, field) == value, (character.pk, field)
+
+        self.stdout.write(f'Characters:   {len(characters)}')
+        self.stdout.write(f'Per-instance: {instance_time * 1000:.1f} ms')
+        self.stdout.write(f'Batch:        {batch_time * 1000:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(
+            f'Speedup:      {instance_time / batch_time:.1f}x'
+        ))
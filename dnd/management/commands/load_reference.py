@@ -0,0 +1,226 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dnd import reference
+from dnd.models import Background, DnDClass, Race, Spell, Weapon
+
+MODELS = {
+    'backgrounds': Background,
+    'classes': DnDClass,
+    'races': Race,
+    'spells': Spell,
+    'weapons': Weapon,
+}
+
+FORMATS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+
+# Whitespace allowed between JSON tokens
+WHITESPACE = ' \t\r\n'
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Yields the items of a top level JSON array one at a time, reading the
+    file in chunks rather than loading it whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        return not eof
+
+    def skip(chars):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or not read_more():
+                return
+
+    skip(WHITESPACE)
+    if buffer[position:position + 1] != '[':
+        raise ValueError('Expected a JSON array')
+    position += 1
+    skip(WHITESPACE)
+    if buffer[position:position + 1] == ']':
+        return
+
+    while True:
+        if position >= len(buffer):
+            raise ValueError('Unexpected end of JSON array')
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The item may continue in the next chunk
+                if read_more():
+                    continue
+                raise
+            separator = end
+            while separator < len(buffer) and buffer[separator] in WHITESPACE:
+                separator += 1
+            # Without a separator after it, the item may have been cut
+            # short, e.g. "12" of "1234" or "-5" of "-5.0"
+            if (separator == len(buffer) or buffer[separator] not in ',]') \
+                    and read_more():
+                continue
+            break
+
+        if separator == len(buffer):
+            raise ValueError('Unexpected end of JSON array')
+        if buffer[separator] not in ',]':
+            raise ValueError(
+                f'Expected "," or "]" after an array item, got {buffer[separator]!r}'
+            )
+        yield item
+        if buffer[separator] == ']':
+            return
+        position = separator + 1
+        skip(WHITESPACE)
+
+
+def iter_json_lines(file):
+    for line in file:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Load reference content (spells, weapons, races, classes or ' \
+           'backgrounds) from a JSON, JSON lines or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'kind', choices=sorted(MODELS),
+            help='Type of content in the file.',
+        )
+        parser.add_argument(
+            'path',
+            help='File to load. Records are matched to existing rows by '
+                 'name, so loading the same file twice is harmless.',
+        )
+        parser.add_argument(
+            '--format', choices=sorted(set(FORMATS.values())),
+            help='File format. Guessed from the extension by default.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of records written per batch.',
+        )
+
+    def handle(self, *args, **options):
+        model = MODELS[options['kind']]
+        path = options['path']
+        file_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower()
+        )
+        if not file_format:
+            raise CommandError(f'Cannot tell the format of {path}. Use --format.')
+
+        self.model = model
+        self.fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.editable and not field.is_relation
+        ]
+        self.ignored = set()
+
+        created = updated = 0
+        try:
+            with open(path, newline='' if file_format == 'csv' else None) as file:
+                if file_format == 'json':
+                    records = iter_json_array(file)
+                elif file_format == 'jsonl':
+                    records = iter_json_lines(file)
+                else:
+                    records = csv.DictReader(file)
+
+                for batch in batched(records, options['batch_size']):
+                    batch_created, batch_updated = self.load_batch(batch)
+                    created += batch_created
+                    updated += batch_updated
+                    self.stderr.write(
+                        f'  - {created + updated} records', ending='\r',
+                    )
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not load {path}: {e}')
+        finally:
+            # Bulk writes skip the signals that normally do this
+            reference.bump_version()
+
+        if self.ignored:
+            self.stderr.write(self.style.WARNING(
+                f"Ignored unknown columns: {', '.join(sorted(self.ignored))}"
+            ))
+        self.stderr.write(self.style.SUCCESS(
+            f'Loaded {options["kind"]}: {created} created, {updated} updated'
+        ))
+
+    def clean(self, record):
+        if not isinstance(record, dict):
+            raise ValueError(f'Expected an object, got {record!r}')
+        if not record.get('name'):
+            raise ValueError(f'Record has no name: {record!r}')
+
+        values = {}
+        for key, value in record.items():
+            if key in self.fields:
+                values[key] = value
+            else:
+                self.ignored.add(key)
+        return values
+
+    @transaction.atomic
+    def load_batch(self, batch):
+        model = self.model
+        records = {}
+        for record in batch:
+            values = self.clean(record)
+            # Later duplicates of a name win
+            records[values['name']] = values
+
+        existing = model.objects.in_bulk(list(records), field_name='name')
+        new, changed = [], []
+        for name, values in records.items():
+            instance = existing.get(name)
+            if instance is None:
+                new.append(model(**values))
+            elif any(getattr(instance, k) != v for k, v in values.items()):
+                for key, value in values.items():
+                    setattr(instance, key, value)
+                changed.append(instance)
+
+        model.objects.bulk_create(new)
+        if changed:
+            model.objects.bulk_update(changed, self.fields)
+
+        if model is Spell:
+            Spell.objects.filter(name__in=records).update_search_vectors()
+
+        return len(new), len(changed)
@@ -0,0 +1,88 @@
+import json
+from timeit import default_timer
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dnd.models import Campaign
+from dnd.simulation import simulate_encounter
+
+
+class Command(BaseCommand):
+    help = "Simulate combats between a campaign's party and some monsters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'campaign', type=int,
+            help='ID of the campaign whose characters make up the party.',
+        )
+        parser.add_argument(
+            'monsters',
+            help='JSON file with a list of monsters. Each needs a name, '
+                 'hit_points, armor_class, attack_bonus and damage (a dice '
+                 'expression), and may have an initiative modifier and a '
+                 'count.',
+        )
+        parser.add_argument(
+            '-n', '--trials', type=int, default=10000,
+            help='Number of combats to simulate.',
+        )
+        parser.add_argument(
+            '-w', '--workers', type=int, default=None,
+            help='Number of worker processes. Defaults to the CPU count.',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Seed for repeatable results.',
+        )
+        parser.add_argument(
+            '--max-rounds', type=int, default=100,
+            help='Rounds after which a combat is called off.',
+        )
+
+    def load_monsters(self, path):
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read monsters from {path}: {e}')
+
+        monsters = []
+        for entry in data:
+            count = int(entry.pop('count', 1))
+            for i in range(1, count + 1):
+                monster = dict(entry)
+                if count > 1:
+                    monster['name'] = f"{entry['name']} {i}"
+                monsters.append(monster)
+        return monsters
+
+    def handle(self, *args, **options):
+        try:
+            campaign = Campaign.objects.get(pk=options['campaign'])
+        except Campaign.DoesNotExist:
+            raise CommandError(f"Campaign {options['campaign']} does not exist")
+        monsters = self.load_monsters(options['monsters'])
+
+        start = default_timer()
+        try:
+            result = simulate_encounter(
+                campaign, monsters,
+                trials=options['trials'],
+                workers=options['workers'],
+                seed=options['seed'],
+                max_rounds=options['max_rounds'],
+            )
+        except (KeyError, ValueError) as e:
+            raise CommandError(str(e))
+        elapsed = default_timer() - start
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{result.trials} combats in {elapsed:.2f}s'
+        ))
+        self.stdout.write(f'  Win rate:        {result.win_rate:.1%}')
+        self.stdout.write(f'  Expected rounds: {result.expected_rounds:.2f}')
+        if result.unfinished:
+            self.stdout.write(f'  Called off:      {result.unfinished}')
+        self.stdout.write('  Expected hit points remaining:')
+        for name, hit_points in result.expected_hit_points.items():
+            self.stdout.write(f'    {name}: {hit_points:.1f}')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from dnd import resources
+from dnd.models import Character
+
+
+class Command(BaseCommand):
+    help = 'Fold pending hit point, hit dice and inspiration changes into ' \
+           'the character rows. Meant to run periodically, e.g. from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--campaign', type=int, action='append',
+            help='Only snapshot characters in this campaign. Can be repeated.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of characters updated per transaction, so players '
+                 'are never locked out for long.',
+        )
+
+    def handle(self, *args, **options):
+        characters = Character.objects.filter(
+            resource_events__applied=False,
+        ).distinct().order_by('pk')
+        if options['campaign']:
+            characters = characters.filter(campaign__in=options['campaign'])
+
+        total = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                characters.filter(pk__gt=last_pk)
+                .values_list('pk', flat=True)[:options['batch_size']]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            total += resources.snapshot(Character.objects.filter(pk__in=pks))
+
+        self.stderr.write(self.style.SUCCESS(
+            f'Snapshotted {total} characters'
+        ))
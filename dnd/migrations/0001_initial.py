@@ -0,0 +1,267 @@
+# Generated by Django 3.1.3 on 2026-10-18 03:40
+
+from django.conf import settings
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # For the gin_trgm_ops index on Spell.name
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.CreateModel(
+            name='Arsenal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Background',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Character',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exp_points', models.IntegerField(default=0)),
+                ('alignment', models.CharField(choices=[('chaotic_good', 'Chaotic Good')], max_length=50)),
+                ('str_score', models.IntegerField(default=10)),
+                ('dex_score', models.IntegerField(default=10)),
+                ('con_score', models.IntegerField(default=10)),
+                ('int_score', models.IntegerField(default=10)),
+                ('wis_score', models.IntegerField(default=10)),
+                ('cha_score', models.IntegerField(default=10)),
+                ('saving_throw_prof', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(choices=[('str', 'Strength'), ('dex', 'Dexterity'), ('con', 'Constitution'), ('int', 'Intelligence'), ('wis', 'Wisdom'), ('cha', 'Charisma')], max_length=50), size=None)),
+                ('skill_prof', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(choices=[('acrobatics', 'Acrobatics'), ('animal_handling', 'Animal Handling'), ('arcana', 'Arcana'), ('athletics', 'Athletics'), ('deception', 'Deception'), ('history', 'History'), ('insight', 'Insight'), ('intimidation', 'Intimidation'), ('investigation', 'Investigation'), ('medicine', 'Medicine'), ('nature', 'Nature'), ('perception', 'Perception'), ('performance', 'Performance'), ('persuasion', 'Persuasion'), ('religion', 'Religion'), ('sleight_of_hand', 'Sleight of Hand'), ('stealth', 'Stealth'), ('survival', 'Survival')], max_length=50), default=list, size=None)),
+                ('skill_expert', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(choices=[('acrobatics', 'Acrobatics'), ('animal_handling', 'Animal Handling'), ('arcana', 'Arcana'), ('athletics', 'Athletics'), ('deception', 'Deception'), ('history', 'History'), ('insight', 'Insight'), ('intimidation', 'Intimidation'), ('investigation', 'Investigation'), ('medicine', 'Medicine'), ('nature', 'Nature'), ('perception', 'Perception'), ('performance', 'Performance'), ('persuasion', 'Persuasion'), ('religion', 'Religion'), ('sleight_of_hand', 'Sleight of Hand'), ('stealth', 'Stealth'), ('survival', 'Survival')], max_length=50), default=list, size=None)),
+                ('tool_proficiencies', models.TextField(blank=True, null=True)),
+                ('languages', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(choices=[('dwarvish', 'Dwarvish')], max_length=50), default=list, size=None)),
+                ('age', models.IntegerField(default=18)),
+                ('gender', models.CharField(max_length=20)),
+                ('height', models.CharField(max_length=10)),
+                ('weight', models.IntegerField(default=100)),
+                ('appearance', models.TextField(blank=True, null=True)),
+                ('personality_traits', models.TextField(blank=True, null=True)),
+                ('ideals', models.TextField(blank=True, null=True)),
+                ('bonds', models.TextField(blank=True, null=True)),
+                ('flaws', models.TextField(blank=True, null=True)),
+                ('background_story', models.TextField(blank=True, null=True)),
+                ('hit_points_max', models.IntegerField(default=6)),
+                ('current_hit_points', models.IntegerField(default=6)),
+                ('hit_dice_max', models.CharField(max_length=10)),
+                ('current_hit_dice', models.CharField(max_length=10)),
+                ('inspiration', models.IntegerField(default=0)),
+                ('level', models.IntegerField(db_index=True, default=1, editable=False)),
+                ('proficiency_bonus', models.IntegerField(default=2, editable=False)),
+                ('str_mod', models.IntegerField(default=0, editable=False)),
+                ('dex_mod', models.IntegerField(default=0, editable=False)),
+                ('con_mod', models.IntegerField(default=0, editable=False)),
+                ('int_mod', models.IntegerField(default=0, editable=False)),
+                ('wis_mod', models.IntegerField(default=0, editable=False)),
+                ('cha_mod', models.IntegerField(default=0, editable=False)),
+                ('initiative', models.IntegerField(default=0, editable=False)),
+                ('passive_perception', models.IntegerField(default=10, editable=False)),
+                ('skill_mods', models.JSONField(default=dict, editable=False)),
+                ('sheet_versions', models.JSONField(default=dict, editable=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DnDClass',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Encounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('round', models.IntegerField(default=1)),
+                ('state', models.JSONField(default=dict, editable=False)),
+                ('ended', models.BooleanField(default=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Inventory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Race',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReferenceVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResourceEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(choices=[('hit_points', 'Hit points'), ('hit_dice', 'Hit dice'), ('inspiration', 'Inspiration')], max_length=20)),
+                ('delta', models.IntegerField()),
+                ('damage_type', models.CharField(blank=True, max_length=20)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('applied', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Spell',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Wallet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Weapon',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Spellbook',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spells', models.ManyToManyField(to='dnd.Spell')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='spell',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='dnd_spell_search__626dc0_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='spell',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='dnd_spell_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddField(
+            model_name='resourceevent',
+            name='character',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resource_events', to='dnd.character'),
+        ),
+        migrations.AddField(
+            model_name='resourceevent',
+            name='reverts',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reverted_by', to='dnd.resourceevent'),
+        ),
+        migrations.AddField(
+            model_name='resourceevent',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='encounter',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='encounters', to='dnd.campaign'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='arsenal',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.arsenal'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='background',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.background'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='backpack',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.inventory'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='campaign',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='characters', to='dnd.campaign'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='classes',
+            field=models.ManyToManyField(to='dnd.DnDClass'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='player',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='characters', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='race',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.race'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='spellbook',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.spellbook'),
+        ),
+        migrations.AddField(
+            model_name='character',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dnd.wallet'),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='dungeon_master',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dm_campaigns', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='arsenal',
+            name='weapons',
+            field=models.ManyToManyField(to='dnd.Weapon'),
+        ),
+        migrations.AddIndex(
+            model_name='resourceevent',
+            index=models.Index(condition=models.Q(applied=False), fields=['character'], name='dnd_resourceevent_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='encounter',
+            index=models.Index(fields=['campaign', 'ended'], name='dnd_encount_campaig_7348f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='character',
+            index=models.Index(fields=['campaign', '-initiative', '-dex_mod'], name='dnd_charact_campaig_3bf386_idx'),
+        ),
+    ]
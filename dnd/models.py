@@ -1,13 +1,26 @@
-from django.db import models
+from bisect import bisect_right
+
+from django.db import connections, models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from project.utils.models import User
 
+from . import dice
+from .combat import Combatant, InitiativeTracker
+from .pubsub import publish_combat_event
+
 ALIGNMENTS = [
     ('chaotic_good', 'Chaotic Good'),
 ]
 
+# Minimum experience points for each level, starting at level 1
 EXP_TO_LEVEL = [
-
+    0, 300, 900, 2700, 6500, 14000, 23000, 34000, 48000, 64000,
+    85000, 100000, 120000, 140000, 165000, 195000, 225000, 265000, 305000,
+    355000,
 ]
 
 ABILITIES = [
@@ -20,24 +33,299 @@ ABILITIES = [
 ]
 
 SKILLS = [
+    ('acrobatics', 'Acrobatics'),
+    ('animal_handling', 'Animal Handling'),
+    ('arcana', 'Arcana'),
     ('athletics', 'Athletics'),
+    ('deception', 'Deception'),
+    ('history', 'History'),
+    ('insight', 'Insight'),
+    ('intimidation', 'Intimidation'),
+    ('investigation', 'Investigation'),
+    ('medicine', 'Medicine'),
+    ('nature', 'Nature'),
+    ('perception', 'Perception'),
+    ('performance', 'Performance'),
+    ('persuasion', 'Persuasion'),
+    ('religion', 'Religion'),
+    ('sleight_of_hand', 'Sleight of Hand'),
+    ('stealth', 'Stealth'),
+    ('survival', 'Survival'),
 ]
 
 ABILITIES_TO_SKILLS = {
+    'str': ['athletics'],
+    'dex': ['acrobatics', 'sleight_of_hand', 'stealth'],
+    'con': [],
+    'int': ['arcana', 'history', 'investigation', 'nature', 'religion'],
+    'wis': ['animal_handling', 'insight', 'medicine', 'perception', 'survival'],
+    'cha': ['deception', 'intimidation', 'performance', 'persuasion'],
+}
 
+SKILLS_TO_ABILITIES = {
+    skill: ability
+    for ability, skills in ABILITIES_TO_SKILLS.items()
+    for skill in skills
 }
 
 LANGUAGES = [
     ('dwarvish', 'Dwarvish'),
 ]
 
+
+def ability_modifier(score):
+    return (score - 10) // 2
+
+
+def level_for_exp(exp_points):
+    return max(1, bisect_right(EXP_TO_LEVEL, exp_points))
+
+
+def proficiency_bonus_for_level(level):
+    return 2 + (level - 1) // 4
+
+
+class ReferenceVersion(models.Model):
+    """
+    A single row counting writes to reference data (races, classes,
+    backgrounds, weapons and spells). See dnd.reference.
+    """
+    version = models.BigIntegerField(default=0)
+
+
+class CampaignQuerySet(models.QuerySet):
+
+    def with_party(self):
+        """
+        Loads each campaign's characters along with everything shown on
+        their sheets, in a fixed number of queries regardless of party size.
+        """
+        party = Character.objects.for_sheet().in_initiative_order()
+        return self.select_related('dungeon_master').prefetch_related(
+            models.Prefetch('characters', queryset=party),
+        )
+
+
 class Campaign(models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField(null=True, blank=True)
     dungeon_master = models.ForeignKey(User, related_name="dm_campaigns", on_delete=models.CASCADE)
-    
+
+    objects = CampaignQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class Race(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class DnDClass(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Background(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Inventory(models.Model):
+    pass
+
+
+class Wallet(models.Model):
+    pass
+
+
+class Weapon(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Arsenal(models.Model):
+    weapons = models.ManyToManyField(Weapon)
+
+
+class SpellQuerySet(models.QuerySet):
+
+    def update_search_vectors(self):
+        """
+        Refreshes the full-text search vectors. Only Postgres has them; on
+        other databases spells are searched with the in-process index in
+        dnd.search instead.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        return self.update(search_vector=(
+            SearchVector('name', weight='A')
+            + SearchVector('description', weight='B')
+        ))
+
+
+class Spell(models.Model):
+    name = models.CharField(max_length=255, unique=True)
+    description = models.TextField(null=True, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SpellQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            # Needs the pg_trgm extension (TrigramExtension in migrations)
+            GinIndex(fields=['name'], name='dnd_spell_name_trgm',
+                     opclasses=['gin_trgm_ops']),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Spell.objects.filter(pk=self.pk).update_search_vectors()
+
+
+class Spellbook(models.Model):
+    spells = models.ManyToManyField(Spell)
+
+
+class BumpSheetVersions(models.Expression):
+    """
+    The sheet_versions column with the counters of ``sections`` incremented.
+    It is computed by the database from the stored value, so bumps made by
+    concurrent saves and updates are never lost.
+    """
+
+    def __init__(self, *sections):
+        super().__init__(output_field=models.JSONField())
+        self.sections = tuple(dict.fromkeys(sections))
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({", ".join(map(repr, self.sections))})'
+
+    def resolve_expression(self, query=None, allow_joins=True, reuse=None,
+                           summarize=False, for_save=False):
+        resolved = self.copy()
+        resolved.is_summary = summarize
+        resolved.column = models.F('sheet_versions').resolve_expression(
+            query, allow_joins, reuse, summarize, for_save,
+        )
+        return resolved
+
+    def as_sql(self, compiler, connection):
+        # JSON_SET() on SQLite and MySQL
+        column, column_params = compiler.compile(self.column)
+        sql, params = column, list(column_params)
+        for section in self.sections:
+            path = f'$."{section}"'
+            sql = f'JSON_SET({sql}, %s, COALESCE(JSON_EXTRACT({column}, %s), 0) + 1)'
+            params = [*params, path, *column_params, path]
+        return sql, params
+
+    def as_postgresql(self, compiler, connection):
+        column, column_params = compiler.compile(self.column)
+        sql, params = column, list(column_params)
+        for section in self.sections:
+            sql = (
+                f'jsonb_set({sql}, ARRAY[%s], '
+                f'to_jsonb(COALESCE(({column} ->> %s)::int, 0) + 1))'
+            )
+            params = [*params, section, *column_params, section]
+        return sql, params
+
+
+class CharacterQuerySet(models.QuerySet):
+
+    def for_sheet(self):
+        """
+        Loads the related objects shown on a character sheet up front, so
+        rendering any number of sheets takes the same number of queries.
+        """
+        # Race and background come from the reference data cache instead,
+        # see race_info and background_info
+        return self.select_related(
+            'campaign', 'player', 'backpack', 'wallet', 'arsenal', 'spellbook',
+        ).prefetch_related(
+            'classes', 'arsenal__weapons', 'spellbook__spells',
+        )
+
+    def in_initiative_order(self):
+        return self.order_by('-initiative', '-dex_mod', 'pk')
+
+    def bump_sheet_versions(self, *sections):
+        """
+        Invalidates the cached sheet fragments for ``sections`` of every
+        character in the queryset.
+        """
+        return self.update(sheet_versions=BumpSheetVersions(*sections))
+
+    def update(self, **kwargs):
+        # Bulk updates skip Character.save(), so bump the versions of the
+        # sheet sections they change here. bulk_update() comes through here
+        # too.
+        if 'sheet_versions' not in kwargs:
+            opts = self.model._meta
+            changed = {opts.get_field(name).attname for name in kwargs}
+            sections = [
+                section for section, names in Character.SHEET_SECTIONS.items()
+                if changed.intersection(names)
+            ]
+            if sections:
+                kwargs['sheet_versions'] = BumpSheetVersions(*sections)
+        return super().update(**kwargs)
+
 
 class Character(models.Model):
+    # Fields the derived stats below are computed from. Saving a character
+    # only recomputes its stats when one of these has changed.
+    STAT_SOURCE_FIELDS = [
+        'exp_points',
+        'str_score', 'dex_score', 'con_score',
+        'int_score', 'wis_score', 'cha_score',
+        'skill_prof', 'skill_expert',
+    ]
+    STAT_FIELDS = [
+        'level', 'proficiency_bonus',
+        'str_mod', 'dex_mod', 'con_mod', 'int_mod', 'wis_mod', 'cha_mod',
+        'initiative', 'passive_perception', 'skill_mods',
+    ]
+    # Fields shown in each separately cached section of the character sheet.
+    # Saving a character bumps the sheet version of each section whose
+    # fields changed, so only those fragments are re-rendered.
+    SHEET_SECTIONS = {
+        'header': ['exp_points', 'alignment', 'race_id', 'background_id'],
+        'hit_points': [
+            'hit_points_max', 'current_hit_points',
+            'hit_dice_max', 'current_hit_dice', 'inspiration',
+        ],
+        'abilities': [
+            'exp_points', 'str_score', 'dex_score', 'con_score',
+            'int_score', 'wis_score', 'cha_score',
+        ],
+        'skills': STAT_SOURCE_FIELDS,
+        'inventory': ['arsenal_id', 'backpack_id', 'wallet_id'],
+        'spells': ['spellbook_id'],
+    }
+    TRACKED_FIELDS = sorted({
+        *STAT_SOURCE_FIELDS,
+        *[name for names in SHEET_SECTIONS.values() for name in names],
+    })
+
     campaign = models.ForeignKey(Campaign, related_name="characters", on_delete=models.CASCADE)
     player = models.ForeignKey(User, related_name="characters", on_delete=models.CASCADE)
     exp_points = models.IntegerField(default=0)
@@ -51,7 +339,7 @@ class Character(models.Model):
     saving_throw_prof = ArrayField(models.CharField(max_length=50, choices=ABILITIES))
     skill_prof = ArrayField(models.CharField(max_length=50, choices=SKILLS), default=list)
     skill_expert = ArrayField(models.CharField(max_length=50, choices=SKILLS), default=list)
-    tool_proficiencies = TextField(null=True, blank=True)
+    tool_proficiencies = models.TextField(null=True, blank=True)
     languages = ArrayField(models.CharField(max_length=50, choices=LANGUAGES), default=list)
     age = models.IntegerField(default=18)
     gender = models.CharField(max_length=20)
@@ -76,70 +364,375 @@ class Character(models.Model):
     arsenal = models.ForeignKey(Arsenal, on_delete=models.CASCADE)
     spellbook = models.ForeignKey(Spellbook, on_delete=models.CASCADE)
 
-    @property
-    def level(self):
-        pass
+    # Derived stats, materialized by update_stats() so that listing and
+    # ordering characters doesn't need any per-row Python work. These are
+    # kept up to date on save and should not be set directly.
+    level = models.IntegerField(default=1, db_index=True, editable=False)
+    proficiency_bonus = models.IntegerField(default=2, editable=False)
+    str_mod = models.IntegerField(default=0, editable=False)
+    dex_mod = models.IntegerField(default=0, editable=False)
+    con_mod = models.IntegerField(default=0, editable=False)
+    int_mod = models.IntegerField(default=0, editable=False)
+    wis_mod = models.IntegerField(default=0, editable=False)
+    cha_mod = models.IntegerField(default=0, editable=False)
+    initiative = models.IntegerField(default=0, editable=False)
+    passive_perception = models.IntegerField(default=10, editable=False)
+    skill_mods = models.JSONField(default=dict, editable=False)
 
-    @property
-    def str_mod(self):
-        pass
+    # Per-section version counters for the cached sheet fragments, keyed by
+    # SHEET_SECTIONS names
+    sheet_versions = models.JSONField(default=dict, editable=False)
 
-    @property
-    def dex_mod(self):
-        pass
+    objects = CharacterQuerySet.as_manager()
 
-    @property
-    def con_mod(self):
-        pass
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', '-initiative', '-dex_mod']),
+        ]
+
+    # Snapshot of TRACKED_FIELDS as of the last load or save
+    _tracked = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._tracked = instance.get_tracked()
+        return instance
+
+    def get_tracked(self):
+        # Read through __dict__ so deferred fields aren't fetched
+        tracked = {}
+        for name in self.TRACKED_FIELDS:
+            value = self.__dict__.get(name)
+            if isinstance(value, list):
+                value = tuple(value)
+            tracked[name] = value
+        return tracked
+
+    def changed_fields(self):
+        """
+        Returns the names of tracked fields changed since the character was
+        loaded or last saved. Unsaved characters count as all changed.
+        """
+        if self._tracked is None:
+            return set(self.TRACKED_FIELDS)
+        current = self.get_tracked()
+        return {
+            name for name, value in current.items()
+            if self._tracked[name] != value
+        }
+
+    def stats_changed(self):
+        return bool(self.changed_fields() & set(self.STAT_SOURCE_FIELDS))
+
+    def bump_sheet_versions(self, *sections):
+        """
+        Invalidates the cached sheet fragments for ``sections`` once saved.
+        Existing characters are bumped by the database, see
+        BumpSheetVersions, and sheet_versions is reloaded when next read
+        after the save. Does not save.
+        """
+        if self._state.adding:
+            versions = dict(self.sheet_versions)
+            for section in sections:
+                versions[section] = versions.get(section, 0) + 1
+            self.sheet_versions = versions
+            return
+
+        pending = self.__dict__.get('sheet_versions')
+        if isinstance(pending, BumpSheetVersions):
+            sections = (*pending.sections, *sections)
+        self.sheet_versions = BumpSheetVersions(*sections)
+
+    def update_stats(self):
+        """
+        Recompute the materialized stats from the underlying scores,
+        experience and proficiencies. Does not save.
+        """
+        self.level = level_for_exp(self.exp_points)
+        self.proficiency_bonus = proficiency_bonus_for_level(self.level)
+        for ability, _ in ABILITIES:
+            score = getattr(self, f'{ability}_score')
+            setattr(self, f'{ability}_mod', ability_modifier(score))
+        self.skill_mods = {
+            skill: self.compute_skill_mod(skill) for skill, _ in SKILLS
+        }
+        self.initiative = self.dex_mod
+        self.passive_perception = 10 + self.skill_mods['perception']
+
+    def compute_skill_mod(self, skill):
+        ability = SKILLS_TO_ABILITIES[skill]
+        modifier = ability_modifier(getattr(self, f'{ability}_score'))
+        if skill in self.skill_expert:
+            return modifier + 2 * self.proficiency_bonus
+        if skill in self.skill_prof:
+            return modifier + self.proficiency_bonus
+        return modifier
+
+    def skill_mod(self, skill):
+        try:
+            return self.skill_mods[skill]
+        except KeyError:
+            return self.compute_skill_mod(skill)
 
     @property
-    def wis_mod(self):
-        pass
+    def ability_table(self):
+        """(label, score, modifier) for each ability, for the sheet."""
+        return [
+            (label, getattr(self, f'{ability}_score'),
+             getattr(self, f'{ability}_mod'))
+            for ability, label in ABILITIES
+        ]
 
     @property
-    def int_mod(self):
-        pass
+    def skill_table(self):
+        """(label, modifier, proficient) for each skill, for the sheet."""
+        return [
+            (label, self.skill_mod(skill),
+             skill in self.skill_prof or skill in self.skill_expert)
+            for skill, label in SKILLS
+        ]
 
     @property
-    def cha_mod(self):
-        pass
+    def race_info(self):
+        from . import reference
+        try:
+            return reference.lookup('races', self.race_id)
+        except KeyError:
+            # Not visible to the cache yet, e.g. its version bump hasn't
+            # committed
+            return self.race
 
     @property
-    def initiative(self):
-        pass
+    def background_info(self):
+        from . import reference
+        try:
+            return reference.lookup('backgrounds', self.background_id)
+        except KeyError:
+            return self.background
 
     @property
-    def passive_perception(self):
-        pass
+    def hit_die(self):
+        """
+        The die rolled for hit points on level up, e.g. "d8" for characters
+        with "3d8" hit dice. Raises ValueError for multiclass characters,
+        whose hit die depends on the class they level up in.
+        """
+        sides = {term.sides for term in dice.parse(self.hit_dice_max).terms}
+        if len(sides) != 1:
+            raise ValueError(
+                f'No single hit die in {self.hit_dice_max!r}, it depends on '
+                'the class leveled up in'
+            )
+        return f'd{sides.pop()}'
 
-    def skill_mod(self, skill):
-        pass
+    def level_up_hit_points(self):
+        """
+        Exact distribution of the hit points gained on the next level up: one
+        hit die plus the constitution modifier, with a minimum of 1.
+        """
+        expression = f'1{self.hit_die}{self.con_mod:+d}'
+        return dice.parse(expression).distribution().clip(1)
 
-class Race(models.Model):
-    pass
+    def save(self, *args, **kwargs):
+        changed = self.changed_fields()
+        extra_fields = []
+        if changed & set(self.STAT_SOURCE_FIELDS):
+            self.update_stats()
+            extra_fields.extend(self.STAT_FIELDS)
 
-class DnDClass(models.Model):
-    pass
+        sections = [
+            section for section, names in self.SHEET_SECTIONS.items()
+            if changed.intersection(names)
+        ]
+        if sections:
+            self.bump_sheet_versions(*sections)
+            extra_fields.append('sheet_versions')
 
-class Background(models.Model):
-    pass
+        previous_hit_points = None
+        if self._tracked is not None and 'current_hit_points' in changed:
+            previous_hit_points = self._tracked['current_hit_points']
+            if previous_hit_points is None:
+                # Deferred when loaded, so read what is about to be replaced
+                previous_hit_points = (
+                    type(self)._base_manager.using(self._state.db)
+                    .filter(pk=self.pk)
+                    .values_list('current_hit_points', flat=True).first()
+                )
 
-class Inventory(models.Model):
-    pass
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and extra_fields:
+            kwargs['update_fields'] = {*update_fields, *extra_fields}
+        super().save(*args, **kwargs)
+        if isinstance(self.__dict__.get('sheet_versions'), BumpSheetVersions):
+            # Deferred, so the bumped value is loaded when next needed
+            del self.__dict__['sheet_versions']
 
-class Wallet(models.Model):
-    pass
+        if previous_hit_points is not None \
+                and self.current_hit_points != previous_hit_points:
+            self.publish_hit_points(self.current_hit_points - previous_hit_points)
+        self._tracked = self.get_tracked()
 
-class Arsenal(models.Model):
-    weapons = models.ManyToManyField(Weapon)
+    def publish_hit_points(self, delta):
+        """
+        Pushes this character's hit points to the campaign's combat channel
+        once the current transaction commits.
+        """
+        event = {
+            'type': 'hp',
+            'character': self.pk,
+            'current_hit_points': self.current_hit_points,
+            'delta': delta,
+        }
+        transaction.on_commit(
+            lambda: publish_combat_event(self.campaign_id, event),
+        )
 
-class Weapon(models.Model):
-    pass
 
-class Spellbook(models.Model):
-    spells = models.ManyToManyField(Spell)
+class ResourceEventQuerySet(models.QuerySet):
 
-class Spell(models.Model):
-    name = models.CharField(max_length=255)
-    description = models.TextField(null=True, blank=True)
-    
+    def pending(self):
+        """
+        Events not yet folded into the character's snapshot columns.
+        """
+        return self.filter(applied=False).order_by('pk')
+
+
+class ResourceEvent(models.Model):
+    """
+    An append-only record of a change to a character's hit points, hit dice
+    or inspiration. See dnd.resources.
+    """
+    RESOURCES = [
+        ('hit_points', 'Hit points'),
+        ('hit_dice', 'Hit dice'),
+        ('inspiration', 'Inspiration'),
+    ]
+
+    character = models.ForeignKey(Character, related_name="resource_events", on_delete=models.CASCADE)
+    resource = models.CharField(max_length=20, choices=RESOURCES)
+    delta = models.IntegerField()
+    # For hit point changes, e.g. "fire"
+    damage_type = models.CharField(max_length=20, blank=True)
+    user = models.ForeignKey(User, null=True, blank=True, related_name="+", on_delete=models.SET_NULL)
+    # The event this one undoes, if any
+    reverts = models.OneToOneField(
+        'self', null=True, blank=True, related_name="reverted_by",
+        on_delete=models.SET_NULL,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    # Whether the change is included in the character's own columns
+    applied = models.BooleanField(default=False)
+
+    objects = ResourceEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Only a handful of events are pending at any time
+            models.Index(
+                fields=['character'], name='dnd_resourceevent_pending',
+                condition=models.Q(applied=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.get_resource_display()} {self.delta:+d}'
+
+
+class EncounterQuerySet(models.QuerySet):
+
+    def in_progress(self):
+        return self.filter(ended=False)
+
+
+class Encounter(models.Model):
+    """
+    A fight in a campaign. The turn order is kept in ``state``, see
+    dnd.combat.InitiativeTracker.
+    """
+    campaign = models.ForeignKey(Campaign, related_name="encounters", on_delete=models.CASCADE)
+    name = models.CharField(max_length=255, blank=True)
+    round = models.IntegerField(default=1)
+    state = models.JSONField(default=dict, editable=False)
+    ended = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = EncounterQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', 'ended']),
+        ]
+
+    def __str__(self):
+        return self.name or f'Encounter {self.pk}'
+
+    def get_tracker(self):
+        if self.state:
+            return InitiativeTracker.from_state(self.state)
+
+        tracker = InitiativeTracker()
+        for character in self.campaign.characters.select_related('player'):
+            tracker.insert(Combatant.from_character(character))
+        return tracker
+
+    def save_tracker(self, tracker):
+        self.state = tracker.to_state()
+        self.round = tracker.round
+        self.save(update_fields=['state', 'round'])
+
+
+@receiver(m2m_changed, sender=Character.classes.through)
+def bump_sheet_versions_on_class_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    The derived stats don't depend on classes, but the sheet header lists
+    them. Invalidate it whenever a character gains or loses a class.
+    """
+    if action in ('post_add', 'post_remove'):
+        if reverse:
+            characters = Character.objects.filter(pk__in=pk_set or ())
+        else:
+            characters = Character.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        # The cleared characters aren't passed along, so find them first
+        if reverse:
+            characters = Character.objects.filter(classes=instance)
+        else:
+            characters = Character.objects.filter(pk=instance.pk)
+    else:
+        return
+
+    characters.bump_sheet_versions('header')
+
+
+@receiver(m2m_changed, sender=Arsenal.weapons.through)
+@receiver(m2m_changed, sender=Spellbook.spells.through)
+def bump_sheet_versions_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Weapons and spells live on the arsenal and spellbook, so changing them
+    doesn't save the character. Invalidate its sheet fragments here instead.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if sender is Arsenal.weapons.through:
+        section, owner = 'inventory', 'arsenal'
+    else:
+        section, owner = 'spells', 'spellbook'
+
+    if reverse:
+        owners = {f'{owner}__in': pk_set or ()}
+    else:
+        owners = {owner: instance}
+
+    Character.objects.filter(**owners).bump_sheet_versions(section)
+
+
+def bump_reference_version(sender, **kwargs):
+    from . import reference
+    reference.bump_version(using=kwargs.get('using', 'default'))
+
+
+for reference_model in [Race, DnDClass, Background, Weapon, Spell]:
+    post_save.connect(bump_reference_version, sender=reference_model)
+    post_delete.connect(bump_reference_version, sender=reference_model)
@@ -0,0 +1,106 @@
+"""Publish/subscribe for live campaign updates
+
+Events such as HP changes and turn advances are published to a per-campaign
+channel and pushed to every websocket subscribed to it (see dnd.consumers).
+
+The broker is chosen with the COMBAT_BROKER setting, a dotted path to a
+class with the same interface as InProcessBroker. The default in-process
+broker only reaches websockets served by the same process, so deployments
+running several ASGI workers should swap in one backed by a message broker
+(e.g. Redis pub/sub).
+"""
+
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = 'dnd.pubsub.InProcessBroker'
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+class Subscription:
+    """
+    An async iterator over the messages published to a channel. Slow
+    subscribers drop their oldest messages rather than buffer forever.
+    """
+
+    def __init__(self, broker, channel, loop, max_queued=100):
+        self.broker = broker
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=max_queued)
+
+    def put(self, message):
+        # Publishers may run in another thread, e.g. a sync view
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+
+    def __init__(self):
+        self.subscriptions = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """
+        Subscribes to ``channel``. Must be called from a running event loop.
+        """
+        subscription = Subscription(self, channel, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[subscription.channel]
+
+    def publish(self, channel, message):
+        """
+        Sends ``message``, a JSON serializable dict, to every subscriber of
+        ``channel``. Safe to call from any thread.
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(message)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'COMBAT_BROKER', DEFAULT_BROKER)
+                _broker = import_string(path)()
+    return _broker
+
+
+def combat_channel(campaign_id):
+    return f'campaign.{campaign_id}.combat'
+
+
+def publish_combat_event(campaign_id, event):
+    get_broker().publish(combat_channel(campaign_id), event)
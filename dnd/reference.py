@@ -0,0 +1,143 @@
+"""Process-wide cache of reference data
+
+Races, classes, backgrounds, weapons and spells rarely change, so get()
+keeps all of them in process memory as read-only mappings of pk to compact,
+immutable records (named tuples of the model's fields).
+
+Coherence between processes comes from ReferenceVersion, a single row
+version stamp that is bumped after any write to reference data commits:
+saves and deletes through the ORM bump it via signals, and bulk writers such
+as the load_reference command call bump_version() themselves. Each process
+checks the stamp at most once every REFERENCE_CACHE_CHECK_INTERVAL seconds
+(5 by default) and reloads everything when it has moved, so requests don't
+pay a round-trip each.
+"""
+
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import transaction
+from django.db.models import F
+
+from .models import (
+    Background, DnDClass, Race, ReferenceVersion, Spell, Weapon,
+)
+
+REFERENCE_MODELS = {
+    'races': Race,
+    'classes': DnDClass,
+    'backgrounds': Background,
+    'weapons': Weapon,
+    'spells': Spell,
+}
+
+_record_types = {}
+_data = None
+_checked_at = None
+_lock = threading.Lock()
+
+
+def record_type(model):
+    """
+    Returns the named tuple type used to cache instances of ``model``.
+    """
+    if model not in _record_types:
+        fields = [
+            field.attname for field in model._meta.concrete_fields
+            if not field.primary_key
+            and not isinstance(field, SearchVectorField)
+        ]
+        _record_types[model] = namedtuple(model.__name__, ['pk', *fields])
+    return _record_types[model]
+
+
+def load(model):
+    record = record_type(model)
+    rows = model.objects.values_list('pk', *record._fields[1:])
+    return MappingProxyType({row[0]: record(*row) for row in rows})
+
+
+class ReferenceData:
+    """
+    A snapshot of all reference data at a given version.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        for name, model in REFERENCE_MODELS.items():
+            setattr(self, name, load(model))
+
+
+def current_version():
+    version = ReferenceVersion.objects.values_list('version', flat=True)
+    return version.first() or 0
+
+
+def get():
+    """
+    Returns the cached ReferenceData, reloading it if the version stamp has
+    moved since it was loaded.
+    """
+    global _data, _checked_at
+    interval = getattr(settings, 'REFERENCE_CACHE_CHECK_INTERVAL', 5)
+
+    data = _data
+    if data is not None and _checked_at is not None \
+            and time.monotonic() - _checked_at < interval:
+        return data
+
+    with _lock:
+        if _data is not None and _checked_at is not None \
+                and time.monotonic() - _checked_at < interval:
+            return _data
+
+        # Read the version before the data. If a write lands in between,
+        # the data is newer than its version and the next check reloads.
+        version = current_version()
+        if _data is None or _data.version != version:
+            _data = ReferenceData(version)
+        _checked_at = time.monotonic()
+        return _data
+
+
+def lookup(kind, pk):
+    """
+    Returns the cached record of the ``kind`` (e.g. "races") with ``pk``.
+    A row added by another process may not be in this process' cache yet,
+    so a miss checks the version stamp again before raising KeyError.
+    """
+    try:
+        return getattr(get(), kind)[pk]
+    except KeyError:
+        expire()
+        return getattr(get(), kind)[pk]
+
+
+def expire():
+    """
+    Makes the next get() in this process check the version stamp.
+    """
+    global _checked_at
+    _checked_at = None
+
+
+def bump_version(using='default'):
+    """
+    Invalidates cached reference data in every process once the current
+    transaction commits.
+    """
+    def bump():
+        updated = ReferenceVersion.objects.using(using).filter(pk=1).update(
+            version=F('version') + 1,
+        )
+        if not updated:
+            ReferenceVersion.objects.using(using).get_or_create(
+                pk=1, defaults={'version': 1},
+            )
+        expire()
+
+    transaction.on_commit(bump, using=using)
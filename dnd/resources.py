@@ -0,0 +1,301 @@
+"""Character resources
+
+Hit points, hit dice and inspiration change constantly during play. Rather
+than rewriting the wide character row on every change, each change is
+appended to the narrow ResourceEvent table. A character's current value is
+the value in its own column (the snapshot) with its pending events applied
+in order, each clamped to the resource's limits.
+
+snapshot() folds pending events back into the character columns and marks
+them applied. Run it periodically with the snapshot_resources command; the
+events are kept as the history the DM can undo from.
+
+apply_hit_points() is the exception, for area damage and mass healing: it
+updates the hit points of many characters in one statement and records the
+changes as already applied events.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from .models import Character, ResourceEvent
+from .pubsub import publish_combat_event
+
+# Resource name to the Character field holding its snapshot
+RESOURCES = {
+    'hit_points': 'current_hit_points',
+    'hit_dice': 'current_hit_dice',
+    'inspiration': 'inspiration',
+}
+
+
+def parse_hit_dice(text):
+    """
+    Returns {sides: count} for a hit dice field, e.g. {10: 2, 8: 1} for a
+    multiclass "2d10+1d8".
+    """
+    counts = defaultdict(int)
+    for part in (text or '').replace(' ', '').split('+'):
+        if part:
+            count, _, sides = part.partition('d')
+            counts[int(sides)] += int(count or 1)
+    return dict(counts)
+
+
+def format_hit_dice(counts):
+    """
+    The hit dice field for {sides: count}, largest dice first.
+    """
+    text = '+'.join(
+        f'{count}d{sides}'
+        for sides, count in sorted(counts.items(), reverse=True) if count
+    )
+    return text or f'0d{max(counts)}'
+
+
+def count_dice(text):
+    """
+    The number of dice in a hit dice field, e.g. 3 for "2d10+1d8".
+    """
+    return sum(parse_hit_dice(text).values())
+
+
+def adjust_hit_dice(character, value):
+    """
+    Returns ``character``'s current hit dice changed to ``value`` dice in
+    all. Dice are spent and recovered largest first, never above the
+    number of each size in hit_dice_max.
+    """
+    counts = parse_hit_dice(character.current_hit_dice)
+    limits = parse_hit_dice(character.hit_dice_max)
+    change = value - sum(counts.values())
+    for sides in sorted(set(counts) | set(limits), reverse=True):
+        count = counts.get(sides, 0)
+        if change < 0:
+            step = -min(-change, count)
+        else:
+            step = min(change, max(0, limits.get(sides, 0) - count))
+        counts[sides] = count + step
+        change -= step
+    return format_hit_dice(counts)
+
+
+def get_value(character, resource):
+    value = getattr(character, RESOURCES[resource])
+    if resource == 'hit_dice':
+        return count_dice(value)
+    return value
+
+
+def set_value(character, resource, value):
+    if value == get_value(character, resource):
+        return
+    if resource == 'hit_dice':
+        value = adjust_hit_dice(character, value)
+    setattr(character, RESOURCES[resource], value)
+
+
+def get_limit(character, resource):
+    if resource == 'hit_points':
+        return character.hit_points_max
+    if resource == 'hit_dice':
+        return count_dice(character.hit_dice_max)
+    return None
+
+
+def clamp(character, resource, value):
+    value = max(0, value)
+    limit = get_limit(character, resource)
+    return value if limit is None else min(limit, value)
+
+
+def fold(character, events):
+    """
+    Returns {resource: value} for ``character`` after ``events``.
+    """
+    values = {resource: get_value(character, resource) for resource in RESOURCES}
+    for event in events:
+        values[event.resource] = clamp(
+            character, event.resource, values[event.resource] + event.delta,
+        )
+    return values
+
+
+def pending(characters):
+    """
+    Returns {character pk: [pending events]} for ``characters``, in one
+    query.
+    """
+    events = defaultdict(list)
+    queryset = ResourceEvent.objects.filter(
+        character__in=[character.pk for character in characters],
+    ).pending()
+    for event in queryset:
+        events[event.character_id].append(event)
+    return events
+
+
+def load_current(characters):
+    """
+    Sets the resources of ``characters`` to their current values, without
+    saving. Returns {character pk: pk of the last event applied}, which
+    changes whenever the values may have.
+    """
+    events = pending(characters)
+    versions = {}
+    for character in characters:
+        character_events = events.get(character.pk, [])
+        for resource, value in fold(character, character_events).items():
+            set_value(character, resource, value)
+        versions[character.pk] = character_events[-1].pk if character_events else 0
+    return versions
+
+
+def current(character):
+    """
+    Returns {resource: value} with the current values for ``character``.
+    """
+    return fold(character, pending([character]).get(character.pk, []))
+
+
+def record(character, resource, delta, user=None, reverts=None):
+    """
+    Records a change of ``delta`` to one of ``character``'s resources,
+    clamped to the resource's limits. The event holds the change actually
+    made, so undoing it restores the value from before. Only locks the
+    character row, without writing to it.
+    """
+    if resource not in RESOURCES:
+        raise ValueError(f'Unknown resource {resource!r}')
+
+    with transaction.atomic():
+        # Serializes changes to the character, which each start from the
+        # value the ones before left
+        locked = Character.objects.select_for_update().only(
+            'pk', 'campaign_id', 'hit_points_max', 'hit_dice_max',
+            *RESOURCES.values(),
+        ).get(pk=character.pk)
+        value = current(locked)[resource]
+        delta = clamp(locked, resource, value + delta) - value
+
+        event = ResourceEvent.objects.create(
+            character=locked, resource=resource, delta=delta, user=user,
+            reverts=reverts,
+        )
+        if resource == 'hit_points':
+            publish(locked.campaign_id, locked.pk, value + delta, delta)
+    return event
+
+
+def publish(campaign_id, character_id, value, delta):
+    message = {
+        'type': 'hp',
+        'character': character_id,
+        'current_hit_points': value,
+        'delta': delta,
+    }
+    transaction.on_commit(
+        lambda: publish_combat_event(campaign_id, message),
+    )
+
+
+def undo(event, user=None):
+    """
+    Records the opposite of ``event``. Events are never changed or deleted,
+    so undoing a change is a change too.
+    """
+    if event.reverts_id is not None:
+        raise ValueError('An undo cannot be undone')
+    if ResourceEvent.objects.filter(reverts=event).exists():
+        raise ValueError('This change has already been undone')
+    return record(
+        event.character, event.resource, -event.delta, user=user,
+        reverts=event,
+    )
+
+
+def snapshot(characters=None):
+    """
+    Folds the pending events of ``characters`` (a queryset, all characters
+    by default) into their own columns. Returns the number of characters
+    updated.
+    """
+    if characters is None:
+        characters = Character.objects.all()
+
+    with transaction.atomic():
+        characters = list(
+            characters.filter(pk__in=ResourceEvent.objects.pending().values('character'))
+            .select_for_update()
+            .only('pk', 'hit_points_max', 'hit_dice_max', *RESOURCES.values())
+        )
+        events = pending(characters)
+
+        for character in characters:
+            for resource, value in fold(character, events[character.pk]).items():
+                set_value(character, resource, value)
+
+        # Skips Character.save, as these values have already been published.
+        # The update bumps the hit_points sheet version.
+        Character.objects.bulk_update(characters, list(RESOURCES.values()))
+        ResourceEvent.objects.filter(
+            pk__in=[e.pk for character_events in events.values() for e in character_events],
+        ).update(applied=True)
+
+    return len(characters)
+
+
+def apply_hit_points(campaign, changes, user=None):
+    """
+    Applies ``changes``, a list of (character pk, delta, damage type), to
+    the hit points of characters in ``campaign`` in one transaction. Changes
+    are applied in order, each clamped between 0 and the character's
+    maximum, and each event records the change actually made, so undoing it
+    restores the hit points from before.
+
+    Returns {character pk: (hit points, actual change)}. Characters not in
+    the campaign are left out.
+    """
+    pks = {character_id for character_id, _, _ in changes}
+    if not pks:
+        return {}
+
+    with transaction.atomic():
+        characters = Character.objects.filter(campaign=campaign, pk__in=pks)
+        # Pending events come first, or the clamping would happen out of order
+        snapshot(characters)
+        limits, old = {}, {}
+        for pk, value, limit in characters.select_for_update().values_list(
+                'pk', 'current_hit_points', 'hit_points_max'):
+            old[pk], limits[pk] = value, limit
+
+        values = dict(old)
+        events = []
+        for character_id, delta, damage_type in changes:
+            if character_id not in values:
+                continue
+            value = max(0, min(limits[character_id], values[character_id] + delta))
+            events.append(ResourceEvent(
+                character_id=character_id, resource='hit_points',
+                delta=value - values[character_id],
+                damage_type=damage_type or '', user=user, applied=True,
+            ))
+            values[character_id] = value
+
+        changed = [pk for pk, value in values.items() if value != old[pk]]
+        if changed:
+            # One statement for everyone, which also bumps the hit_points
+            # sheet version
+            characters.filter(pk__in=changed).update(current_hit_points=Case(
+                *[When(pk=pk, then=Value(values[pk])) for pk in changed],
+                output_field=IntegerField(),
+            ))
+        ResourceEvent.objects.bulk_create(events)
+
+        results = {pk: (value, value - old[pk]) for pk, value in values.items()}
+        for character_id, (value, delta) in results.items():
+            publish(campaign.pk, character_id, value, delta)
+
+    return results
@@ -0,0 +1,224 @@
+"""Spell search
+
+search_spells() ranks spells against a free text query. On Postgres it uses
+the weighted ``search_vector`` column (name over description) with a GIN
+index, plus trigram similarity on the name so that typos still match. On
+other databases, e.g. sqlite in development, it falls back to SpellIndex.
+
+typeahead() always answers from SpellIndex, a compact in-process index of
+spell names built from the cached reference data in dnd.reference. Prefix
+lookups are a binary search over sorted names that stops once it has enough
+matches, and typo-tolerant matches come from a trigram posting list, so
+lookups take a few milliseconds at most even for a full SRD plus homebrew
+catalogue.
+The index is rebuilt whenever the reference data version changes.
+"""
+
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, TrigramSimilarity,
+)
+from django.db import connections
+from django.db.models import F, Q
+
+from . import reference
+from .models import Spell
+
+# Minimum name similarity for a fuzzy match
+SIMILARITY_THRESHOLD = 0.3
+
+WORD = re.compile(r'\w+')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize(text):
+    return ' '.join(WORD.findall((text or '').lower()))
+
+
+def trigrams(text):
+    """
+    The set of three letter sequences in each word of ``text``, padded the
+    same way as Postgres' pg_trgm so similarity scores are comparable.
+    """
+    grams = set()
+    for word in WORD.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SpellIndex:
+    """
+    An in-memory index of spell names and description words.
+    """
+
+    def __init__(self, spells, version=None):
+        self.version = version
+        self.names = {}
+        # Sorted (normalized name, pk) pairs and (word, normalized name, pk)
+        # triples for each word in a name, for prefix lookups
+        self.name_prefixes = []
+        self.word_prefixes = []
+        self.trigrams = defaultdict(set)
+        self.name_words = defaultdict(set)
+        self.description_words = defaultdict(set)
+        self.name_trigrams = {}
+
+        for pk, name, description in spells:
+            self.names[pk] = name
+            normalized = normalize(name)
+            self.name_prefixes.append((normalized, pk))
+            for word in normalized.split():
+                self.word_prefixes.append((word, normalized, pk))
+                self.name_words[word].add(pk)
+            for word in set(WORD.findall((description or '').lower())):
+                self.description_words[word].add(pk)
+            grams = trigrams(name)
+            self.name_trigrams[pk] = grams
+            for gram in grams:
+                self.trigrams[gram].add(pk)
+
+        self.name_prefixes.sort()
+        self.word_prefixes.sort()
+
+    @classmethod
+    def build(cls, data):
+        spells = (
+            (spell.pk, spell.name, spell.description)
+            for spell in data.spells.values()
+        )
+        return cls(spells, version=data.version)
+
+    def fuzzy(self, text):
+        """
+        Returns {pk: similarity} for names similar to ``text``.
+        """
+        grams = trigrams(text)
+        overlap = Counter()
+        for gram in grams:
+            overlap.update(self.trigrams.get(gram, ()))
+
+        # The union is at least as big as ``grams``, so names sharing fewer
+        # trigrams than this can't reach the threshold
+        minimum = SIMILARITY_THRESHOLD * len(grams)
+        scores = {}
+        for pk, shared in overlap.items():
+            if shared < minimum:
+                continue
+            union = len(grams) + len(self.name_trigrams[pk]) - shared
+            score = shared / union
+            if score >= SIMILARITY_THRESHOLD:
+                scores[pk] = score
+        return scores
+
+    def prefix(self, text, limit):
+        """
+        Returns up to ``limit`` pks of spells whose name starts with
+        ``text``, then of spells with another word in the name that does,
+        each alphabetically.
+        """
+        text = normalize(text)
+        if not text:
+            return []
+
+        matches = []
+        seen = set()
+        for entries in (self.name_prefixes, self.word_prefixes):
+            # Entries are sorted, so the matches are the run starting here
+            for entry in islice(entries, bisect_left(entries, (text,)), None):
+                if len(matches) >= limit or not entry[0].startswith(text):
+                    break
+                pk = entry[-1]
+                if pk not in seen:
+                    seen.add(pk)
+                    matches.append(pk)
+        return matches
+
+    def typeahead(self, text, limit=10):
+        """
+        Returns up to ``limit`` (pk, name) pairs for spells whose name, or a
+        word in it, starts with ``text``, falling back to fuzzy matches.
+        """
+        matches = self.prefix(text, limit)
+        # Trigrams of very short input match nearly everything
+        if len(matches) < limit and len(text.strip()) >= 3:
+            fuzzy = self.fuzzy(text)
+            extra = sorted(
+                (pk for pk in fuzzy if pk not in matches),
+                key=lambda pk: -fuzzy[pk],
+            )
+            matches.extend(extra[:limit - len(matches)])
+        return [(pk, self.names[pk]) for pk in matches]
+
+    def search(self, text, limit=10):
+        """
+        Returns up to ``limit`` (pk, name) pairs ranked by matching words,
+        with name matches weighted over description matches, and by name
+        similarity.
+        """
+        scores = defaultdict(float)
+        for word in WORD.findall(text.lower()):
+            for pk in self.name_words.get(word, ()):
+                scores[pk] += 1.0
+            for pk in self.description_words.get(word, ()):
+                scores[pk] += 0.4
+        for pk, similarity in self.fuzzy(text).items():
+            scores[pk] += similarity
+
+        ranked = sorted(scores, key=lambda pk: (-scores[pk], self.names[pk]))
+        return [(pk, self.names[pk]) for pk in ranked[:limit]]
+
+
+def get_index():
+    global _index
+    data = reference.get()
+    index = _index
+    if index is None or index.version != data.version:
+        with _index_lock:
+            if _index is None or _index.version != data.version:
+                _index = SpellIndex.build(data)
+            index = _index
+    return index
+
+
+def search_spells(query, limit=10, using='default'):
+    """
+    Returns up to ``limit`` spells matching ``query``, best matches first.
+    """
+    query = query.strip()
+    if not query:
+        return []
+
+    if connections[using].vendor != 'postgresql':
+        pks = [pk for pk, _ in get_index().search(query, limit)]
+        spells = Spell.objects.using(using).in_bulk(pks)
+        return [spells[pk] for pk in pks if pk in spells]
+
+    search_query = SearchQuery(query, search_type='websearch')
+    return list(
+        Spell.objects.using(using)
+        .annotate(
+            rank=SearchRank(F('search_vector'), search_query),
+            similarity=TrigramSimilarity('name', query),
+        )
+        .filter(
+            Q(search_vector=search_query)
+            | Q(similarity__gte=SIMILARITY_THRESHOLD)
+        )
+        .order_by('-rank', '-similarity', 'name')
+        .defer('description', 'search_vector')[:limit]
+    )
+
+
+def typeahead(text, limit=10):
+    """
+    Returns up to ``limit`` (pk, name) pairs for a spell lookup box.
+    """
+    return get_index().typeahead(text, limit)
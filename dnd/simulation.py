@@ -0,0 +1,249 @@
+"""Monte Carlo encounter simulation
+
+simulate_encounter() plays out many combats between a campaign's characters
+and a list of monsters and reports the party's win rate, the expected number
+of rounds and the hit points the party has left.
+
+Trials are split into fixed-size shards, each simulated with NumPy across all
+of its trials at once and seeded from its own child of a single SeedSequence.
+Shards are run on a process pool and their totals summed, so results for a
+given seed are the same no matter how many workers run them.
+
+The combat model is deliberately simple: everyone rolls initiative, then on
+their turn each living combatant makes one attack against a random living
+enemy. A natural 20 always hits and a natural 1 always misses. Combat ends
+when one side is down or after ``max_rounds`` rounds.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import dice, resources
+
+# Trials per shard. Kept independent of the worker count so that a seed
+# always produces the same result.
+SHARD_SIZE = 5000
+
+
+class Combatant:
+    """
+    The combat stats of a character or monster.
+    """
+
+    def __init__(self, name, hit_points, armor_class, attack_bonus, damage,
+                 initiative=0, party=False):
+        self.name = name
+        self.hit_points = hit_points
+        self.armor_class = armor_class
+        self.attack_bonus = attack_bonus
+        self.damage = damage
+        self.initiative = initiative
+        self.party = party
+
+    def __repr__(self):
+        return f'<Combatant: {self.name}>'
+
+    @classmethod
+    def from_character(cls, character):
+        """
+        Characters don't track armor or weapons yet, so this assumes
+        unarmored defense and a d8 weapon using their better of strength and
+        dexterity.
+        """
+        modifier = max(character.str_mod, character.dex_mod)
+        return cls(
+            name=str(character.player),
+            hit_points=character.current_hit_points,
+            armor_class=10 + character.dex_mod,
+            attack_bonus=character.proficiency_bonus + modifier,
+            damage=f'1d8{modifier:+d}',
+            initiative=character.initiative,
+            party=True,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            name=data['name'],
+            hit_points=int(data['hit_points']),
+            armor_class=int(data['armor_class']),
+            attack_bonus=int(data['attack_bonus']),
+            damage=data['damage'],
+            initiative=int(data.get('initiative', 0)),
+            party=bool(data.get('party', False)),
+        )
+
+
+class EncounterResult:
+
+    def __init__(self, combatants, trials, wins, rounds, unfinished,
+                 hit_points):
+        self.combatants = combatants
+        self.trials = trials
+        self.wins = wins
+        self.rounds = rounds
+        self.unfinished = unfinished
+        # Total remaining hit points per party member, summed over trials
+        self.hit_points = hit_points
+
+    def __add__(self, other):
+        return EncounterResult(
+            self.combatants,
+            self.trials + other.trials,
+            self.wins + other.wins,
+            self.rounds + other.rounds,
+            self.unfinished + other.unfinished,
+            self.hit_points + other.hit_points,
+        )
+
+    @property
+    def party(self):
+        return [combatant for combatant in self.combatants if combatant.party]
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trials
+
+    @property
+    def expected_rounds(self):
+        return self.rounds / self.trials
+
+    @property
+    def expected_hit_points(self):
+        """Mean remaining hit points of each party member, by name."""
+        means = self.hit_points / self.trials
+        return {
+            combatant.name: float(mean)
+            for combatant, mean in zip(self.party, means)
+        }
+
+    @property
+    def expected_party_hit_points(self):
+        return float(self.hit_points.sum() / self.trials)
+
+
+def _simulate_shard(combatants, trials, seed, max_rounds):
+    rng = np.random.default_rng(seed)
+    count = len(combatants)
+    rows = np.arange(trials)
+
+    party = np.array([c.party for c in combatants])
+    armor_class = np.array([c.armor_class for c in combatants])
+    attack_bonus = np.array([c.attack_bonus for c in combatants])
+    initiative = np.array([c.initiative for c in combatants])
+    damage = [dice.parse(c.damage) for c in combatants]
+    hp = np.tile([c.hit_points for c in combatants], (trials, 1))
+
+    # Turn order per trial: initiative roll, then modifier, then random
+    rolls = rng.integers(1, 21, size=(trials, count)) + initiative
+    keys = rolls * 64 + initiative + rng.random((trials, count))
+    order = np.argsort(-keys, axis=1)
+
+    finished = np.zeros(trials, dtype=bool)
+    rounds = np.zeros(trials, dtype=np.int64)
+
+    for _ in range(max_rounds):
+        if finished.all():
+            break
+        rounds[~finished] += 1
+
+        for turn in range(count):
+            actor = order[:, turn]
+            alive = hp > 0
+            acting = ~finished & alive[rows, actor]
+            if not acting.any():
+                continue
+
+            # Pick a random living enemy for each acting combatant
+            enemies = alive & (party[None, :] != party[actor][:, None])
+            target = np.where(enemies, rng.random((trials, count)), -1)
+            target = target.argmax(axis=1)
+            acting &= enemies[rows, target]
+
+            d20 = rng.integers(1, 21, size=trials)
+            hits = acting & (d20 != 1) & (
+                (d20 == 20)
+                | (d20 + attack_bonus[actor] >= armor_class[target])
+            )
+
+            dealt = np.zeros(trials, dtype=np.int64)
+            for attacker in np.unique(actor[hits]):
+                mask = hits & (actor == attacker)
+                dealt[mask] = damage[attacker].roll(mask.sum(), rng=rng)
+            hp[rows[hits], target[hits]] -= np.maximum(dealt[hits], 0)
+
+            alive = hp > 0
+            finished |= ~(
+                (alive & party).any(axis=1) & (alive & ~party).any(axis=1)
+            )
+
+    alive = hp > 0
+    won = (alive & party).any(axis=1) & ~(alive & ~party).any(axis=1)
+    return EncounterResult(
+        combatants,
+        trials,
+        wins=int(won.sum()),
+        rounds=int(rounds.sum()),
+        unfinished=int((~finished).sum()),
+        hit_points=np.clip(hp[:, party], 0, None).sum(axis=0),
+    )
+
+
+def simulate(combatants, trials=10000, workers=None, seed=None,
+             max_rounds=100):
+    """
+    Simulates ``trials`` combats between the combatants with ``party`` set
+    and the rest. Runs on a pool of ``workers`` processes (one per CPU by
+    default, or inline if 1).
+    """
+    combatants = list(combatants)
+    if not any(c.party for c in combatants) or all(c.party for c in combatants):
+        raise ValueError('An encounter needs combatants on both sides')
+    if trials < 1:
+        raise ValueError('trials must be positive')
+
+    sizes = [SHARD_SIZE] * (trials // SHARD_SIZE)
+    if trials % SHARD_SIZE:
+        sizes.append(trials % SHARD_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    workers = min(workers or os.cpu_count() or 1, len(sizes))
+    args = (
+        [combatants] * len(sizes), sizes, seeds, [max_rounds] * len(sizes),
+    )
+    if workers == 1:
+        results = map(_simulate_shard, *args)
+        return sum(results, _empty_result(combatants))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(_simulate_shard, *args)
+        return sum(results, _empty_result(combatants))
+
+
+def _empty_result(combatants):
+    party_size = sum(1 for c in combatants if c.party)
+    return EncounterResult(
+        combatants, 0, 0, 0, 0, np.zeros(party_size, dtype=np.int64),
+    )
+
+
+def simulate_encounter(campaign, monsters, **kwargs):
+    """
+    Simulates combats between a campaign's characters and ``monsters``, a
+    list of Combatants or dicts accepted by Combatant.from_dict(). Takes the
+    same keyword arguments as simulate().
+    """
+    characters = list(campaign.characters.select_related('player'))
+    # The hit point columns are only snapshots, see dnd.resources
+    resources.load_current(characters)
+    party = [Combatant.from_character(character) for character in characters]
+    monsters = [
+        monster if isinstance(monster, Combatant)
+        else Combatant.from_dict(monster)
+        for monster in monsters
+    ]
+    for monster in monsters:
+        monster.party = False
+    return simulate(party + monsters, **kwargs)
@@ -0,0 +1,153 @@
+"""Batch stat computation for many characters at once
+
+Character.update_stats() works one character and one skill at a time, which
+is fine for a single sheet but slow for DM dashboards that touch thousands of
+characters. compute() loads the raw scores for a whole queryset or list of
+characters into NumPy arrays and derives every modifier, skill bonus and
+proficiency bonus with a handful of array operations.
+
+The formulas match the ones on the Character model, so the results can be
+written straight back onto the materialized stat columns with
+refresh_stats().
+"""
+
+import numpy as np
+from django.db.models import QuerySet
+
+from .models import (
+    ABILITIES, ABILITIES_TO_SKILLS, EXP_TO_LEVEL, SKILLS, Character,
+)
+
+ABILITY_KEYS = [ability for ability, _ in ABILITIES]
+SKILL_KEYS = [skill for skill, _ in SKILLS]
+
+ABILITY_INDEX = {ability: i for i, ability in enumerate(ABILITY_KEYS)}
+SKILL_INDEX = {skill: i for i, skill in enumerate(SKILL_KEYS)}
+
+# For each skill column, the ability column it is based on
+SKILL_ABILITY = np.array([
+    ABILITY_INDEX[ability]
+    for skill in SKILL_KEYS
+    for ability, skills in ABILITIES_TO_SKILLS.items()
+    if skill in skills
+])
+
+SOURCE_FIELDS = [
+    'pk', 'exp_points',
+    *[f'{ability}_score' for ability in ABILITY_KEYS],
+    'skill_prof', 'skill_expert',
+]
+
+
+class CharacterStats:
+    """
+    Derived stats for a batch of characters. Each attribute is an array with
+    one row per character, in the same order as ``ids``.
+    """
+
+    def __init__(self, ids, levels, proficiency_bonus, scores, modifiers,
+                 skills):
+        self.ids = ids
+        self.levels = levels
+        self.proficiency_bonus = proficiency_bonus
+        self.scores = scores
+        self.modifiers = modifiers
+        self.skills = skills
+        self._rows = {pk: row for row, pk in enumerate(ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def initiative(self):
+        return self.modifiers[:, ABILITY_INDEX['dex']]
+
+    @property
+    def passive_perception(self):
+        return 10 + self.skills[:, SKILL_INDEX['perception']]
+
+    def modifier(self, ability):
+        return self.modifiers[:, ABILITY_INDEX[ability]]
+
+    def skill(self, skill):
+        return self.skills[:, SKILL_INDEX[skill]]
+
+    def for_character(self, pk):
+        """
+        Returns the stats of a single character as a dict keyed like the
+        materialized stat fields on Character.
+        """
+        row = self._rows[pk]
+        stats = {
+            'level': int(self.levels[row]),
+            'proficiency_bonus': int(self.proficiency_bonus[row]),
+            'initiative': int(self.initiative[row]),
+            'passive_perception': int(self.passive_perception[row]),
+            'skill_mods': dict(zip(SKILL_KEYS, self.skills[row].tolist())),
+        }
+        for ability in ABILITY_KEYS:
+            stats[f'{ability}_mod'] = int(self.modifier(ability)[row])
+        return stats
+
+
+def _source_rows(characters):
+    if isinstance(characters, QuerySet):
+        return list(characters.values_list(*SOURCE_FIELDS))
+    return [
+        tuple(getattr(character, name) for name in SOURCE_FIELDS)
+        for character in characters
+    ]
+
+
+def compute(characters):
+    """
+    Computes the derived stats for a queryset or list of characters.
+
+    Querysets are read with a single values_list() query, so no model
+    instances are built.
+    """
+    rows = _source_rows(characters)
+    count = len(rows)
+    abilities = len(ABILITY_KEYS)
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    exp_points = np.array([row[1] for row in rows], dtype=np.int64)
+    scores = np.array(
+        [row[2:2 + abilities] for row in rows], dtype=np.int64,
+    ).reshape(count, abilities)
+
+    # 0 = untrained, 1 = proficient, 2 = expertise
+    training = np.zeros((count, len(SKILL_KEYS)), dtype=np.int64)
+    for i, row in enumerate(rows):
+        for skill in row[-2]:
+            training[i, SKILL_INDEX[skill]] = 1
+        for skill in row[-1]:
+            training[i, SKILL_INDEX[skill]] = 2
+
+    levels = np.maximum(
+        1, np.searchsorted(EXP_TO_LEVEL, exp_points, side='right'),
+    )
+    proficiency_bonus = 2 + (levels - 1) // 4
+    modifiers = (scores - 10) // 2
+    skills = modifiers[:, SKILL_ABILITY] + training * proficiency_bonus[:, None]
+
+    return CharacterStats(
+        ids, levels, proficiency_bonus, scores, modifiers, skills,
+    )
+
+
+def refresh_stats(queryset, batch_size=500):
+    """
+    Recomputes and saves the materialized stat columns for every character
+    in ``queryset``. Useful after bulk imports or formula changes, which
+    bypass Character.save().
+    """
+    stats = compute(queryset)
+    characters = [
+        Character(pk=pk, **stats.for_character(pk))
+        for pk in stats.ids.tolist()
+    ]
+    Character.objects.bulk_update(
+        characters, Character.STAT_FIELDS, batch_size=batch_size,
+    )
+    return stats
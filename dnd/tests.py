@@ -0,0 +1,551 @@
+import io
+import json
+import random
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from project.utils.models import User
+
+from . import combat, consumers, dice, reference, resources, simulation, stats
+from .management.commands.load_reference import iter_json_array
+from .models import (
+    EXP_TO_LEVEL, SKILLS, Arsenal, Background, Campaign, Character, DnDClass,
+    Inventory, Race, Spell, Spellbook, Wallet, Weapon,
+)
+
+
+class DnDTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dm = User.objects.create_user('dm', password='password')
+        cls.campaign = Campaign.objects.create(name='Phandelver', dungeon_master=cls.dm)
+        cls.race = Race.objects.create(name='Dwarf')
+        cls.background = Background.objects.create(name='Soldier')
+        cls.dnd_class = DnDClass.objects.create(name='Fighter')
+        cls.weapon = Weapon.objects.create(name='Warhammer')
+        cls.spell = Spell.objects.create(name='Cure Wounds')
+
+    def setUp(self):
+        # Cached sheet fragments and reference data outlive each test's
+        # transaction, and reference version bumps only happen on commit
+        cache.clear()
+        patcher = mock.patch.object(reference, '_data', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_character(self, name, **kwargs):
+        arsenal = Arsenal.objects.create()
+        arsenal.weapons.add(self.weapon)
+        spellbook = Spellbook.objects.create()
+        spellbook.spells.add(self.spell)
+        fields = dict(
+            campaign=self.campaign,
+            player=User.objects.create_user(name),
+            alignment='chaotic_good',
+            saving_throw_prof=['str', 'con'],
+            gender='Female',
+            height='4\'5"',
+            hit_points_max=12,
+            current_hit_points=12,
+            hit_dice_max='1d10',
+            current_hit_dice='1d10',
+            race=self.race,
+            background=self.background,
+            backpack=Inventory.objects.create(),
+            wallet=Wallet.objects.create(),
+            arsenal=arsenal,
+            spellbook=spellbook,
+        )
+        fields.update(kwargs)
+        character = Character.objects.create(**fields)
+        character.classes.add(self.dnd_class)
+        return character
+
+
+class QueryCountTests(DnDTestCase):
+    """
+    Pages showing a party take the same number of queries whatever its
+    size.
+    """
+
+    def get(self, url):
+        # Render every fragment, but with the reference data loaded
+        cache.clear()
+        reference.expire()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def count_queries(self, url):
+        self.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.get(url)
+        return len(queries)
+
+    def test_campaign(self):
+        url = reverse('campaign', args=[self.campaign.pk])
+        self.create_character('gimli')
+        self.client.force_login(self.dm)
+        expected = self.count_queries(url)
+
+        for i in range(5):
+            self.create_character(f'player{i}')
+        with self.assertNumQueries(expected):
+            self.get(url)
+
+    def test_character(self):
+        character = self.create_character('gimli')
+        url = reverse('character', args=[character.pk])
+        self.client.force_login(character.player)
+        expected = self.count_queries(url)
+
+        for i in range(5):
+            self.create_character(f'player{i}')
+        with self.assertNumQueries(expected):
+            self.get(url)
+
+
+class ReferenceTests(DnDTestCase):
+
+    def test_race_added_since_last_check(self):
+        reference.get()
+        race = Race.objects.create(name='Halfling')
+        background = Background.objects.create(name='Urchin')
+        character = self.create_character('bilbo', race=race, background=background)
+        self.assertEqual(character.race_info.name, 'Halfling')
+        self.assertEqual(character.background_info.name, 'Urchin')
+
+
+class SheetVersionTests(DnDTestCase):
+
+    def test_save_bumps_changed_sections(self):
+        character = self.create_character('gimli')
+        versions = Character.objects.get(pk=character.pk).sheet_versions
+
+        character.current_hit_points = 3
+        character.save()
+        self.assertEqual(
+            character.sheet_versions,
+            dict(versions, hit_points=versions.get('hit_points', 0) + 1),
+        )
+
+    def test_concurrent_saves_keep_both_bumps(self):
+        character = self.create_character('gimli')
+        first = Character.objects.get(pk=character.pk)
+        second = Character.objects.get(pk=character.pk)
+        versions = first.sheet_versions
+
+        first.current_hit_points = 3
+        first.save(update_fields=['current_hit_points'])
+        second.exp_points = 300
+        second.save(update_fields=['exp_points'])
+
+        character.refresh_from_db()
+        self.assertEqual(
+            character.sheet_versions['hit_points'], versions.get('hit_points', 0) + 1,
+        )
+        self.assertEqual(
+            character.sheet_versions['header'], versions.get('header', 0) + 1,
+        )
+
+    def test_queryset_update_bumps_changed_sections(self):
+        character = self.create_character('gimli')
+        versions = Character.objects.get(pk=character.pk).sheet_versions
+
+        Character.objects.filter(pk=character.pk).update(current_hit_points=1)
+        character.refresh_from_db()
+        self.assertEqual(
+            character.sheet_versions,
+            dict(versions, hit_points=versions.get('hit_points', 0) + 1),
+        )
+
+    def test_class_changes_bump_header(self):
+        character = self.create_character('gimli')
+        header = Character.objects.get(pk=character.pk).sheet_versions.get('header', 0)
+        wizard = DnDClass.objects.create(name='Wizard')
+
+        # Looking up existing links, inserting and bumping, with no save()
+        with self.assertNumQueries(3):
+            character.classes.add(wizard)
+        wizard.character_set.clear()
+        character.refresh_from_db()
+        self.assertEqual(character.sheet_versions['header'], header + 2)
+
+    def test_adding_weapons_bumps_inventory(self):
+        character = self.create_character('gimli')
+        versions = Character.objects.get(pk=character.pk).sheet_versions
+
+        character.arsenal.weapons.add(Weapon.objects.create(name='Handaxe'))
+        character.refresh_from_db()
+        self.assertEqual(
+            character.sheet_versions,
+            dict(versions, inventory=versions.get('inventory', 0) + 1),
+        )
+
+
+@mock.patch('dnd.models.transaction.on_commit', lambda callback: callback())
+@mock.patch('dnd.models.publish_combat_event')
+class PublishHitPointsTests(DnDTestCase):
+
+    def test_save_publishes_change(self, publish):
+        character = self.create_character('gimli')
+        character = Character.objects.get(pk=character.pk)
+        character.current_hit_points = 5
+        character.save()
+        publish.assert_called_once_with(self.campaign.pk, {
+            'type': 'hp', 'character': character.pk,
+            'current_hit_points': 5, 'delta': -7,
+        })
+
+    def test_save_deferred_hit_points(self, publish):
+        character = self.create_character('gimli')
+        character = Character.objects.defer('current_hit_points').get(pk=character.pk)
+        character.current_hit_points = 5
+        character.save()
+        publish.assert_called_once_with(self.campaign.pk, {
+            'type': 'hp', 'character': character.pk,
+            'current_hit_points': 5, 'delta': -7,
+        })
+
+
+class CurrentHitPointsTests(DnDTestCase):
+    """
+    Pages and simulations show hit points with pending resource events
+    applied.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.character = self.create_character('gimli')
+        resources.record(self.character, 'hit_points', -5)
+
+    def test_campaign(self):
+        self.client.force_login(self.dm)
+        response = self.client.get(reverse('campaign', args=[self.campaign.pk]))
+        self.assertContains(response, '7 / 12')
+
+    def test_simulation(self):
+        with mock.patch.object(simulation, 'simulate', lambda combatants: combatants):
+            party = simulation.simulate_encounter(self.campaign, [])
+        self.assertEqual(
+            [(combatant.name, combatant.hit_points) for combatant in party],
+            [('gimli', 7)],
+        )
+
+
+class ApplyHitPointsTests(DnDTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.character = self.create_character('gimli', current_hit_points=5)
+
+    def test_changes_are_clamped_in_order(self):
+        results = resources.apply_hit_points(self.campaign, [
+            (self.character.pk, -30, 'fire'),
+            (self.character.pk, 10, ''),
+        ])
+        self.assertEqual(results, {self.character.pk: (10, 5)})
+        self.character.refresh_from_db()
+        self.assertEqual(self.character.current_hit_points, 10)
+        self.assertEqual(
+            list(self.character.resource_events.order_by('pk').values_list('delta', flat=True)),
+            [-5, 10],
+        )
+
+    def test_undo_clamped_change(self):
+        resources.apply_hit_points(self.campaign, [(self.character.pk, -30, 'fire')])
+        event = self.character.resource_events.get()
+        self.assertEqual(event.delta, -5)
+
+        resources.undo(event)
+        self.character.refresh_from_db()
+        self.assertEqual(resources.current(self.character)['hit_points'], 5)
+
+    def test_undo_clamped_websocket_change(self):
+        apply = async_to_sync(consumers.apply_hit_point_delta)
+        with mock.patch('dnd.resources.transaction.on_commit', lambda callback: None):
+            apply(self.campaign, self.dm, self.character.pk, -20)
+            event = self.character.resource_events.get()
+            self.assertEqual(event.delta, -5)
+            resources.undo(event)
+        self.assertEqual(resources.current(self.character)['hit_points'], 5)
+
+    def test_other_campaigns_are_left_out(self):
+        other = Campaign.objects.create(name='Tomb', dungeon_master=self.dm)
+        self.assertEqual(resources.apply_hit_points(other, [(self.character.pk, -1, '')]), {})
+        self.character.refresh_from_db()
+        self.assertEqual(self.character.current_hit_points, 5)
+
+
+class HitDiceTests(DnDTestCase):
+    """
+    Multiclass hit dice keep a count per die size.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.character = self.create_character(
+            'gimli', hit_dice_max='2d10+1d8', current_hit_dice='2d10+1d8',
+        )
+
+    def test_count(self):
+        self.assertEqual(resources.count_dice('2d10+1d8'), 3)
+        self.assertEqual(resources.count_dice('0d10'), 0)
+        self.assertEqual(resources.current(self.character)['hit_dice'], 3)
+
+    def current_hit_dice(self):
+        character = Character.objects.get(pk=self.character.pk)
+        resources.load_current([character])
+        return character.current_hit_dice
+
+    def test_spend_and_recover(self):
+        resources.record(self.character, 'hit_dice', -2)
+        self.assertEqual(self.current_hit_dice(), '1d8')
+        resources.record(self.character, 'hit_dice', 1)
+        self.assertEqual(self.current_hit_dice(), '1d10+1d8')
+        resources.record(self.character, 'hit_dice', 5)
+        self.assertEqual(self.current_hit_dice(), '2d10+1d8')
+        resources.record(self.character, 'hit_dice', -3)
+        self.assertEqual(self.current_hit_dice(), '0d10')
+
+    def test_multiclass_hit_die(self):
+        with self.assertRaises(ValueError):
+            self.character.hit_die
+        self.character.hit_dice_max = '3d8'
+        self.assertEqual(self.character.hit_die, 'd8')
+
+
+class StatsTests(SimpleTestCase):
+
+    def random_character(self, pk, rng):
+        skills = [skill for skill, _ in SKILLS]
+        proficient = rng.sample(skills, rng.randint(0, 6))
+        return Character(
+            pk=pk,
+            exp_points=rng.randint(0, EXP_TO_LEVEL[-1] + 10000),
+            skill_prof=proficient,
+            skill_expert=rng.sample(proficient, min(len(proficient), rng.randint(0, 2))),
+            **{
+                f'{ability}_score': rng.randint(1, 30)
+                for ability in stats.ABILITY_KEYS
+            },
+        )
+
+    def test_compute_matches_update_stats(self):
+        rng = random.Random(0)
+        characters = [self.random_character(pk, rng) for pk in range(1, 2001)]
+        batch = stats.compute(characters)
+        for character in characters:
+            character.update_stats()
+            expected = {name: getattr(character, name) for name in Character.STAT_FIELDS}
+            self.assertEqual(batch.for_character(character.pk), expected)
+
+
+class DiceTests(SimpleTestCase):
+
+    def test_parse(self):
+        expression = dice.parse(' 2d6 + d4 - 1D8 + 3 - 1 ')
+        self.assertEqual(str(expression), '2d6+1d4-1d8+2')
+        self.assertEqual(
+            [(t.count, t.sides, t.sign) for t in expression.terms],
+            [(2, 6, 1), (1, 4, 1), (1, 8, -1)],
+        )
+        self.assertEqual((expression.minimum, expression.maximum), (-3, 17))
+
+    def test_parse_keep_and_drop(self):
+        for text, keep, keep_highest in [
+            ('4d6dl1', 3, True), ('4d6kh3', 3, True), ('4d6k3', 3, True),
+            ('2d20kl1', 1, False), ('4d6dh1', 3, False),
+        ]:
+            term = dice.parse(text).terms[0]
+            self.assertEqual((term.keep, term.keep_highest), (keep, keep_highest), text)
+        self.assertEqual(dice.parse('d%').terms[0].sides, 100)
+
+    def test_parse_errors(self):
+        for text in ['', '  ', 'd', '2d', '1d6 2', '1d6 +', 'fireball', '1d6x2',
+                     '0d6', '1d0', '2d6kh3', '4d6dl4', f'{dice.MAX_DICE + 1}d6']:
+            with self.subTest(text=text), self.assertRaises(dice.DiceError):
+                dice.parse(text)
+
+    def test_seeded_rolls_repeat(self):
+        first = dice.roll('4d6dl1+1d8-2', size=1000, seed=42)
+        second = dice.roll('4d6dl1+1d8-2', size=1000, seed=42)
+        self.assertEqual(first.tolist(), second.tolist())
+        self.assertEqual(dice.roll('1d20', seed=7), dice.roll('1d20', seed=7))
+
+        rng = dice.get_rng(42)
+        batches = [dice.roll('2d6', size=10, rng=rng) for _ in range(2)]
+        self.assertNotEqual(batches[0].tolist(), batches[1].tolist())
+        with self.assertRaises(TypeError):
+            dice.roll('1d6', rng=rng, seed=1)
+
+    def test_rolls_stay_in_range(self):
+        expression = dice.parse('1d20-1d4+2d6kh1')
+        rolls = expression.roll(size=10000, seed=0)
+        self.assertGreaterEqual(rolls.min(), expression.minimum)
+        self.assertLessEqual(rolls.max(), expression.maximum)
+
+
+class DistributionTests(SimpleTestCase):
+
+    def test_sum_of_dice(self):
+        distribution = dice.parse('2d6').distribution()
+        self.assertEqual((distribution.minimum, distribution.maximum), (2, 12))
+        self.assertAlmostEqual(distribution.probability(7), 6 / 36)
+        self.assertAlmostEqual(distribution.probability(2), 1 / 36)
+        self.assertEqual(distribution.probability(13), 0)
+        self.assertAlmostEqual(distribution.pmf.sum(), 1)
+
+    def test_keep_highest(self):
+        distribution = dice.parse('4d6kh3').distribution()
+        self.assertEqual((distribution.minimum, distribution.maximum), (3, 18))
+        self.assertAlmostEqual(distribution.mean, 15869 / 1296)
+        self.assertAlmostEqual(distribution.probability(18), 21 / 1296)
+
+    def test_advantage(self):
+        distribution = dice.parse(dice.ADVANTAGE).distribution()
+        self.assertAlmostEqual(distribution.at_least(20), 1 - (19 / 20) ** 2)
+        disadvantage = dice.parse(dice.DISADVANTAGE).distribution()
+        self.assertAlmostEqual(disadvantage.at_least(20), (1 / 20) ** 2)
+
+    def test_subtraction(self):
+        distribution = dice.parse('1d20-1d4').distribution()
+        self.assertEqual((distribution.minimum, distribution.maximum), (-3, 19))
+        self.assertAlmostEqual(distribution.mean, 10.5 - 2.5)
+
+    def test_at_least_and_at_most(self):
+        distribution = dice.parse('1d20+5').distribution()
+        self.assertAlmostEqual(distribution.at_least(15), 11 / 20)
+        self.assertAlmostEqual(distribution.at_most(15), 10 / 20)
+        self.assertAlmostEqual(distribution.at_least(0), 1)
+        self.assertAlmostEqual(distribution.at_least(26), 0)
+
+    def test_clip(self):
+        distribution = dice.parse('1d8-2').distribution().clip(1)
+        self.assertEqual(distribution.minimum, 1)
+        self.assertAlmostEqual(distribution.probability(1), 3 / 8)
+        self.assertAlmostEqual(distribution.pmf.sum(), 1)
+        self.assertEqual(dice.parse('1d4').distribution().clip(10).probability(10), 1)
+
+    def test_matches_rolls(self):
+        expression = dice.parse('3d6dl1+1d4')
+        rolls = expression.roll(size=200000, seed=1)
+        self.assertAlmostEqual(rolls.mean(), expression.distribution().mean, places=1)
+
+
+class IterJsonArrayTests(SimpleTestCase):
+    items = [
+        {'name': 'Fire Bolt', 'description': 'A mote of fire [1d10], "hot"'},
+        12345,
+        -0.5e3,
+        'text with ] and , inside',
+        [1, [2, {'3': None}]],
+        True,
+    ]
+
+    def test_chunk_boundaries(self):
+        text = ' \n[ ' + ' ,\n '.join(json.dumps(item) for item in self.items) + ' ]\n'
+        for chunk_size in range(1, len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                items = list(iter_json_array(io.StringIO(text), chunk_size))
+                self.assertEqual(items, self.items)
+
+    def test_number_at_end_of_chunk(self):
+        # "12" then "34]" would otherwise yield 12
+        self.assertEqual(list(iter_json_array(io.StringIO('[12345]'), 3)), [12345])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_json_array(io.StringIO(' [ ] '), 2)), [])
+
+    def test_malformed(self):
+        for text in ['', '{"name": "x"}', '[1, 2', '[{"name": }]', '[1 2]', '[1,]', '[,1]',
+                     '["unterminated]']:
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                list(iter_json_array(io.StringIO(text), 4))
+
+
+class InitiativeTrackerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tracker = combat.InitiativeTracker()
+        for key, initiative, dex_mod in [
+            ('a', 20, 0), ('b', 15, 3), ('c', 15, 1), ('d', 10, 0),
+        ]:
+            self.tracker.insert(combat.Combatant(key, key.upper(), initiative, dex_mod))
+
+    def turns(self, count, tracker=None):
+        tracker = tracker or self.tracker
+        return [tracker.advance().key for _ in range(count)]
+
+    def order(self, tracker=None):
+        return [combatant.key for combatant in (tracker or self.tracker).order()]
+
+    def test_order(self):
+        self.assertEqual(self.turns(6), ['a', 'b', 'c', 'd', 'a', 'b'])
+        self.assertEqual(self.tracker.round, 2)
+        self.assertEqual(self.order(), ['b', 'c', 'd', 'a'])
+
+    def test_insert_after_active(self):
+        self.turns(2)
+        self.tracker.insert(combat.Combatant('late', 'Late', 12))
+        self.tracker.insert(combat.Combatant('early', 'Early', 18))
+        self.assertEqual(self.order(), ['b', 'c', 'late', 'd', 'a', 'early'])
+        self.assertEqual(self.turns(6), ['c', 'late', 'd', 'a', 'early', 'b'])
+        with self.assertRaises(combat.CombatError):
+            self.tracker.insert(combat.Combatant('a', 'A', 1))
+
+    def test_delay(self):
+        self.turns(1)
+        self.assertEqual(self.tracker.delay(12).key, 'b')
+        self.assertEqual(self.turns(4), ['c', 'a', 'd', 'b'])
+        # The delayed initiative sticks
+        self.assertEqual(self.order(), ['b', 'c', 'a', 'd'])
+        with self.assertRaises(combat.CombatError):
+            self.tracker.delay(30)
+
+    def test_ready_and_trigger(self):
+        self.turns(1)
+        self.assertEqual(self.tracker.ready('the door opens').key, 'b')
+        self.assertEqual(self.tracker.trigger('a'), 'the door opens')
+        with self.assertRaises(combat.CombatError):
+            self.tracker.trigger('a')
+
+        self.tracker.ready('an enemy comes close')
+        self.turns(3)
+        # Lapses at the start of the combatant's next turn
+        self.assertEqual(self.tracker.active, 'b')
+        with self.assertRaises(combat.CombatError):
+            self.tracker.trigger('b')
+
+    def test_remove(self):
+        self.turns(2)
+        self.tracker.remove('c')
+        self.assertEqual(self.order(), ['b', 'd', 'a'])
+        self.tracker.remove('b')
+        self.assertIsNone(self.tracker.active)
+        self.assertEqual(self.turns(3), ['d', 'a', 'd'])
+        self.assertEqual(len(self.tracker), 2)
+        self.assertNotIn('b', self.tracker)
+        with self.assertRaises(combat.CombatError):
+            self.tracker.remove('b')
+
+    def test_state_round_trip(self):
+        self.turns(6)
+        self.tracker.insert(combat.Combatant('late', 'Late', 12))
+        self.tracker.remove('c')
+        self.tracker.delay(5)
+        self.tracker.ready('a spell is cast')
+
+        state = json.loads(json.dumps(self.tracker.to_state()))
+        loaded = combat.InitiativeTracker.from_state(state)
+        self.assertEqual(loaded.round, self.tracker.round)
+        self.assertEqual(loaded.active, self.tracker.active)
+        self.assertEqual(self.order(loaded), self.order())
+        self.assertEqual(self.turns(8, loaded), self.turns(8))
+        self.assertEqual(loaded.to_state(), self.tracker.to_state())
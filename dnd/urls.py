@@ -7,4 +7,13 @@ urlpatterns = [
     # A view named "home" is referenced in a few places.
     # Make sure to update the references if you change or delete this url line!
     url(r'^$', views.HomeView.as_view(), name='home'),
+
+    url(r'^campaigns/(?P<pk>\d+)/$', views.CampaignView.as_view(),
+        name='campaign'),
+    url(r'^campaigns/(?P<pk>\d+)/hit-points/$', views.HitPointsView.as_view(),
+        name='campaign_hit_points'),
+    url(r'^characters/(?P<pk>\d+)/$', views.CharacterView.as_view(),
+        name='character'),
+    url(r'^spells/search/$', views.SpellSearchView.as_view(),
+        name='spell_search'),
 ]
@@ -1,5 +1,114 @@
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
 from django.views import generic
 
+from . import reference, resources, search
+from .models import Campaign, Character
+
+# Cached sheet fragments are keyed on version counters, so they never go
+# stale and this only bounds how long unused fragments are kept
+SHEET_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 class HomeView(generic.TemplateView):
     template_name = 'home.html'
+
+
+class CampaignView(LoginRequiredMixin, generic.DetailView):
+    template_name = 'dnd/campaign.html'
+
+    def get_queryset(self):
+        user = self.request.user
+        return Campaign.objects.with_party().filter(
+            Q(dungeon_master=user) | Q(characters__player=user)
+        ).distinct()
+
+    def get_context_data(self, **kwargs):
+        # The party is prefetched, so this updates the characters the
+        # template shows. Their hit point columns are only snapshots.
+        resources.load_current(self.object.characters.all())
+        return super().get_context_data(**kwargs)
+
+
+class CharacterView(LoginRequiredMixin, generic.DetailView):
+    template_name = 'dnd/character.html'
+
+    def get_queryset(self):
+        user = self.request.user
+        # The sheet sections are cached fragments that load what they show
+        # only when re-rendered, so don't prefetch everything for_sheet()
+        # would here
+        return Character.objects.select_related('campaign', 'player').filter(
+            Q(player=user) | Q(campaign__dungeon_master=user)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['sheet_cache_timeout'] = SHEET_CACHE_TIMEOUT
+        context['reference_version'] = reference.get().version
+        # Hit points and the like are changed by appending events, which
+        # don't bump the sheet version
+        versions = resources.load_current([self.object])
+        context['resource_version'] = versions[self.object.pk]
+        return context
+
+
+class SpellSearchView(LoginRequiredMixin, generic.View):
+    """
+    JSON spell lookup. Answers from the in-process typeahead index unless
+    ``full`` is passed, which runs a ranked full-text search.
+    """
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get('q', '')
+        if request.GET.get('full'):
+            results = [
+                (spell.pk, spell.name)
+                for spell in search.search_spells(query)
+            ]
+        else:
+            results = search.typeahead(query)
+        return JsonResponse({
+            'results': [{'id': pk, 'name': name} for pk, name in results],
+        })
+
+
+class HitPointsView(LoginRequiredMixin, generic.View):
+    """
+    Lets the DM damage or heal several characters at once, e.g. everyone
+    caught in a fireball. Takes a JSON body like:
+
+        {"changes": [{"character": 12, "delta": -24, "damage_type": "fire"}]}
+
+    and returns each character's new hit points and the actual change after
+    clamping.
+    """
+
+    def post(self, request, *args, **kwargs):
+        campaign = get_object_or_404(
+            Campaign, pk=kwargs['pk'], dungeon_master=request.user,
+        )
+        try:
+            data = json.loads(request.body)
+            changes = [
+                (
+                    int(change['character']),
+                    int(change['delta']),
+                    str(change.get('damage_type') or '')[:20],
+                )
+                for change in data['changes']
+            ]
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({'error': 'Invalid changes'}, status=400)
+
+        results = resources.apply_hit_points(campaign, changes, user=request.user)
+        return JsonResponse({
+            'results': [
+                {'character': pk, 'current_hit_points': value, 'delta': delta}
+                for pk, (value, delta) in results.items()
+            ],
+        })
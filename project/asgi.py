@@ -0,0 +1,63 @@
+"""
+ASGI config
+
+It exposes the ASGI callable as a module-level variable named
+``application``. Regular HTTP requests are handled by Django as usual, and
+websocket connections are routed to the live campaign channels in
+dnd.consumers.
+
+Run it with an ASGI server, e.g. ``uvicorn project.asgi:application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os.path
+import re
+
+from django.core.asgi import get_asgi_application
+from environ import Env
+
+
+envfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".env")
+if os.path.exists(envfile):
+    Env.read_env(envfile)
+
+django_application = get_asgi_application()
+
+# Imported after Django is set up, as it uses models
+from dnd.consumers import CombatConsumer  # noqa: E402
+
+WEBSOCKET_ROUTES = [
+    (re.compile(r'^/ws/campaigns/(?P<campaign_id>\d+)/combat/$'), CombatConsumer),
+]
+
+
+async def websocket_application(scope, receive, send):
+    for pattern, consumer in WEBSOCKET_ROUTES:
+        match = pattern.match(scope['path'])
+        if match:
+            return await consumer(scope, receive, send, **match.groupdict())()
+
+    # Reject the handshake for unknown paths
+    message = await receive()
+    if message['type'] == 'websocket.connect':
+        await send({'type': 'websocket.close', 'code': 4404})
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        return await websocket_application(scope, receive, send)
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    return await django_application(scope, receive, send)
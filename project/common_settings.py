@@ -73,11 +73,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that its latency includes the other middleware. See
+    # project.utils.metrics
+    'project.utils.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Profiles requests for staff with ?profile=1, see project.utils.profiling
+    'project.utils.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -239,9 +244,15 @@ if env('SENTRY_DSN'):
 # a good guess is to look at the process's original stderr at sys.__stderr__
 STDERR_ISATTY = sys.stderr.isatty() if hasattr(sys.stderr, "isatty") else sys.__stderr__.isatty()
 
+# Like logging.config.dictConfig, but puts the handlers listed under
+# "queue_handlers" behind a queue so that request threads don't wait on
+# formatting, stderr or SMTP. See project.utils.log.
+LOGGING_CONFIG = 'project.utils.log.configure'
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "queue_handlers": ["stderr", "mail_admins"],
     "filters": {
         'require_debug_false': {
             '()': 'django.utils.log.RequireDebugFalse',
@@ -276,7 +287,10 @@ LOGGING = {
         'mail_admins': {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
-            'class': 'django.utils.log.AdminEmailHandler'
+            # Mails each distinct error at most once every "interval"
+            # seconds, with a count of the repeats held back
+            'class': 'project.utils.log.ThrottledAdminEmailHandler',
+            'interval': 300,
         }
     },
     "loggers": {
@@ -8,7 +8,7 @@ https://docs.djangoproject.com/en/1.11/howto/deployment/checklist/
 """
 
 from ..common_settings import *  # noqa: F401,F403
-from ..common_settings import env, path
+from ..common_settings import LOGGING, env, path
 
 
 # When DEBUG is off (ie, for production), these email addresses will receive
@@ -18,6 +18,15 @@ ADMINS = [
     # ('Admin Name', 'admin.email@example.com'),
 ]
 
+# Emails are queued in the database and delivered by the drain_outbox
+# command, which should be kept running alongside the web workers. See
+# project.utils.mail.
+EMAIL_BACKEND = 'project.utils.mail.OutboxBackend'
+OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Error emails skip the outbox. The errors may well be the database being
+# down, and they shouldn't wait on drain_outbox running.
+LOGGING['handlers']['mail_admins']['email_backend'] = OUTBOX_DELIVERY_BACKEND
+
 # Some security features that we want to ensure we use during production
 # deployments. You can set DISABLE_SSL temporarily when setting things
 # up if you need but don't leave it on for production!
@@ -37,9 +46,15 @@ CSRF_COOKIE_SECURE = ssl_on
 # each time you redeploy with changes to static files.
 STATIC_ROOT = path(env.str("STATIC_ROOT"))
 
-# manifest storage is useful for its automatic cache busting properties
-STATICFILES_STORAGE = 'django.contrib.staticfiles.storage' \
-                      '.ManifestStaticFilesStorage'
+# manifest storage is useful for its automatic cache busting properties. This
+# one also saves compressed copies of each file, and only reprocesses files
+# that changed since the last collectstatic.
+STATICFILES_STORAGE = 'project.utils.staticfiles' \
+                      '.CompressedManifestStaticFilesStorage'
+
+# Without a web server in front, set SERVE_STATIC for project.wsgi to serve
+# the static files itself, compressed and cached for good.
+SERVE_STATIC = env.bool("SERVE_STATIC", False)
 
 
 # Set your MEDIA_ROOT to some directory that's writable by your web server if
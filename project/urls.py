@@ -18,10 +18,14 @@ from django.urls import include, path
 from django.contrib import admin
 
 from project import views
+from project.utils import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
+    # Prometheus metrics, for INTERNAL_IPS and staff
+    path('metrics', metrics.metrics, name='metrics'),
+
     # Auth urls
     path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', views.LogoutView.as_view(), name='logout'),
@@ -1,7 +1,23 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.utils import timezone
 
-from .models import User
+from .models import OutboxMessage, User
 
 
 admin.site.register(User, UserAdmin)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'created', 'attempts', 'sent', 'failed']
+    list_filter = ['failed']
+    search_fields = ['recipients', 'subject']
+    readonly_fields = ['data', 'created', 'sent', 'attempts', 'last_error']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        queryset.filter(sent__isnull=True).update(
+            failed=False, attempts=0, send_after=timezone.now(),
+        )
+    retry.short_description = 'Retry delivery'
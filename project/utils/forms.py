@@ -1,3 +1,6 @@
+import copy
+
+from django.conf import settings
 from django.forms.fields import FileField
 from django.forms.forms import BaseForm
 from django.utils.safestring import mark_safe
@@ -7,15 +10,57 @@ class TemplateForm(BaseForm):
     """
     This mixin should precede `forms.Form` or `forms.ModelForm` to ensure that
     the correct rendering method is called.
+
+    The widget classes are set up once per form class rather than on every
+    instance, and templates are compiled once per renderer. Set
+    `cache_unbound` on forms whose unbound rendering doesn't depend on the
+    constructor arguments (e.g. the login form) to render unbound instances
+    from a cached copy.
     """
     template_name = None
+    cache_unbound = False
+
+    # Compiled templates, keyed on (renderer, template name)
+    _templates = {}
+    # Rendered unbound forms, keyed on (form class, prefix, auto_id, ...)
+    _skeletons = {}
 
     def __init__(self, *args, **kwargs):
+        self.prepare_base_fields()
         super().__init__(*args, **kwargs)
-        for field in self.fields.values():
-            if isinstance(field, FileField):
-                continue
-            field.widget.attrs['class'] = 'form-control'
+        # Fields added in __init__ don't come from base_fields
+        for name in self.fields.keys() - self.base_fields.keys():
+            self.set_widget_attrs(self.fields[name])
+
+    @classmethod
+    def prepare_base_fields(cls):
+        if '_base_fields_prepared' in cls.__dict__:
+            return
+        # The field instances are shared with the parent form classes, so
+        # work on a copy
+        cls.base_fields = copy.deepcopy(cls.base_fields)
+        for field in cls.base_fields.values():
+            cls.set_widget_attrs(field)
+        cls._base_fields_prepared = True
+
+    @staticmethod
+    def set_widget_attrs(field):
+        if isinstance(field, FileField):
+            return
+        field.widget.attrs['class'] = 'form-control'
+
+    def compile_template(self, template_name):
+        # Template debugging implies templates may be edited, so don't hold
+        # on to them
+        if settings.DEBUG:
+            return self.renderer.get_template(template_name)
+
+        key = (self.renderer, template_name)
+        template = self._templates.get(key)
+        if template is None:
+            template = self.renderer.get_template(template_name)
+            self._templates[key] = template
+        return template
 
     def get_template(self, field):
         raise NotImplementedError
@@ -25,10 +70,26 @@ class TemplateForm(BaseForm):
             'form': self,
         }
 
+    def get_skeleton_key(self):
+        if not self.cache_unbound or self.is_bound or self.initial:
+            return None
+        return (
+            type(self), self.renderer, self.template_name, self.prefix,
+            self.auto_id, self.label_suffix,
+        )
+
     def render(self):
+        key = self.get_skeleton_key()
+        if key is not None and key in self._skeletons:
+            return self._skeletons[key]
+
         context = self.get_form_context()
+        template = self.compile_template(self.template_name)
+        html = mark_safe(template.render(context).strip())
 
-        return mark_safe(self.renderer.render(self.template_name, context))
+        if key is not None and not settings.DEBUG:
+            self._skeletons[key] = html
+        return html
 
     def __str__(self):
         return self.render()
@@ -38,11 +99,11 @@ class BlockForm(TemplateForm):
     template_name = 'utils/forms/block.html'
 
     def get_template(self, field):
-        return 'utils/forms/fields/block.html'
+        return self.compile_template('utils/forms/fields/block.html')
 
 
 class HorizontalForm(TemplateForm):
     template_name = 'utils/forms/horizontal.html'
 
     def get_template(self, field):
-        return 'utils/forms/fields/horizontal.html'
+        return self.compile_template('utils/forms/fields/horizontal.html')
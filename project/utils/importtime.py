@@ -0,0 +1,120 @@
+"""Import time measurement
+
+measure() imports a module in a fresh interpreter run with ``-X importtime``
+and returns how long the import took, what each module imported on the way
+cost, and how long each Django app took to import, load its models and get
+ready. It is how the bundle command records worker boot time, and what the
+startup_profile command reports on.
+"""
+
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+from subprocess import PIPE, run
+
+# e.g. "import time:       448 |       8539 |   json.decoder"
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+Import = namedtuple('Import', ['name', 'self_us', 'cumulative_us', 'level'])
+Node = namedtuple('Node', ['name', 'self_us', 'cumulative_us', 'children'])
+App = namedtuple('App', ['label', 'name', 'import_s', 'models_s', 'ready_s'])
+Profile = namedtuple('Profile', ['seconds', 'imports', 'apps'])
+
+# Times each AppConfig's creation, which imports the app, and its
+# import_models() and ready() calls
+SCRIPT = '''
+import json, time
+start = time.perf_counter()
+from django.apps import AppConfig
+
+apps = []
+create = AppConfig.create.__func__
+
+def timed(method, timings, key):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings[key] = time.perf_counter() - started
+    return wrapper
+
+def timed_create(cls, entry):
+    timings = {{'import_s': 0, 'models_s': 0, 'ready_s': 0}}
+    config = timed(create, timings, 'import_s')(cls, entry)
+    config.import_models = timed(config.import_models, timings, 'models_s')
+    config.ready = timed(config.ready, timings, 'ready_s')
+    timings.update(label=config.label, name=config.name)
+    apps.append(timings)
+    return config
+
+AppConfig.create = classmethod(timed_create)
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'apps': apps}}))
+'''
+
+
+class ImportFailed(Exception):
+    pass
+
+
+def parse(output):
+    """
+    Returns the imports reported by ``-X importtime``, in the order they
+    finished, i.e. each module after the modules it imported.
+    """
+    imports = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append(Import(
+                name, int(self_us), int(cumulative_us), len(indent) // 2,
+            ))
+    return imports
+
+
+def build_tree(imports):
+    """
+    Returns the top level imports as Nodes, each with the Nodes of the
+    modules it imported, in import order.
+    """
+    pending = {}
+    for entry in imports:
+        node = Node(
+            entry.name, entry.self_us, entry.cumulative_us,
+            pending.pop(entry.level + 1, []),
+        )
+        pending.setdefault(entry.level, []).append(node)
+    return pending.get(0, [])
+
+
+def measure(module, path=(), env=None, cwd=None, write_bytecode=False):
+    """
+    Imports ``module`` in a new Python process and returns a Profile.
+    ``path`` is prepended to PYTHONPATH. Unless ``write_bytecode`` is set,
+    the tree being measured is left as is.
+    """
+    env = dict(os.environ if env is None else env)
+    env['PYTHONPATH'] = os.pathsep.join(
+        list(path) + [p for p in [env.get('PYTHONPATH')] if p]
+    )
+    if not write_bytecode:
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+    result = run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(module=module)],
+        stdout=PIPE, stderr=PIPE, cwd=cwd, env=env,
+    )
+    stderr = result.stderr.decode(errors='replace')
+    if result.returncode != 0:
+        # The traceback follows the import times
+        raise ImportFailed(
+            '\n'.join(line for line in stderr.splitlines() if not LINE.match(line))
+        )
+    # The module may print too, so only the last line is ours
+    data = json.loads(result.stdout.decode().splitlines()[-1])
+    return Profile(
+        data['seconds'], parse(stderr), [App(**app) for app in data['apps']],
+    )
@@ -5,7 +5,8 @@ system. It may need some tweaks depending on your exact needs, workflow,
 and user model.
 
 The invite_user() function is invoked by any view code that wants to invite a
-user. See its docstring for more info on how to use it.
+user, and invite_users() by code inviting several at once. See their
+docstrings for more info on how to use them.
 
 Also included are two views that you'll need to add to your urls file,
 and add templates for. One view is a landing page for users that have clicked
@@ -14,10 +15,10 @@ password.
 
 The other view is a simple template view shown for invalid tokens.
 
-Note: The default invite_user() function assumes email addresses are unique
-on the user model. If this is an invalid assumption in your project,
-it's recommended to modify the invite_user() function to select users from
-the database in some other way.
+Note: The default invite_users() function assumes email addresses are unique
+(and case insensitive) on the user model. If this is an invalid assumption in
+your project, it's recommended to modify the invite_users() function to select
+users from the database in some other way.
 """
 
 import django.contrib.auth
@@ -27,7 +28,8 @@ from django.contrib.auth.forms import SetPasswordForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.sites.shortcuts import get_current_site
 from django.core import signing
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models.functions import Lower
 from django.db.transaction import atomic
 from django.http import HttpResponseRedirect
 from django.template.loader import render_to_string
@@ -48,40 +50,113 @@ def invite_user(request, email):
     If the user does not exist, it is created, an invite sent, and the new
     user object is returned.
     """
-    try:
-        user = models.User.objects.get(email=email)
-    except models.User.DoesNotExist:
-        with atomic():
-            # Roll back the user creation if the invite sending fails
-            user = models.User.objects.create(email=email)
-            send_invite(request, user)
+    return invite_users(request, [email])[email]
+
+
+def invite_users(request, emails):
+    """Invites several users at once, e.g. a whole gaming table
+
+    Works like invite_user(), but looks up all the existing users in one
+    query, creates the missing ones in one insert and sends every invite over
+    a single mail connection. Returns a dict mapping each email to its user.
+    """
+    emails = list(dict.fromkeys(emails))
+    # Email addresses are matched case insensitively
+    existing = {
+        user.email.lower(): user
+        for user in models.User.objects.annotate(
+            email_lower=Lower('email'),
+        ).filter(email_lower__in=[email.lower() for email in emails])
+    }
+
+    new_emails = {}
+    for email in emails:
+        if email.lower() not in existing:
+            new_emails.setdefault(email.lower(), email)
+    new_emails = list(new_emails.values())
+    resend = [
+        user for user in existing.values() if not user.is_setup()
+    ]
+
+    with atomic():
+        # Roll back the user creation if the invite sending fails
+        usernames = unique_usernames(new_emails)
+        created = models.User.objects.bulk_create([
+            models.User(email=email, username=usernames[email])
+            for email in new_emails
+        ])
+        if any(user.pk is None for user in created):
+            # Only some databases return the new primary keys from a bulk
+            # insert, and the invite tokens need them
+            created = list(models.User.objects.filter(email__in=new_emails))
+
+        site = get_current_site(request)
+        invites = [
+            build_invite(request, user, site=site)
+            for user in created + resend
+        ]
+        if invites:
+            get_connection().send_messages(invites)
+
+    users = {user.email.lower(): user for user in created}
+    users.update(existing)
+
+    if new_emails:
         messages.add_message(
             request,
             messages.SUCCESS,
-            "Invite sent to {}".format(email)
+            "Invite sent to {}".format(", ".join(new_emails))
+        )
+    if resend:
+        messages.add_message(
+            request,
+            messages.INFO,
+            "{} already have accounts but haven't set them up yet. Re-sending "
+            "a new invite".format(", ".join(user.email for user in resend))
+        )
+    already_setup = [
+        user.email for user in existing.values() if user not in resend
+    ]
+    if already_setup:
+        messages.add_message(
+            request,
+            messages.INFO,
+            "{} already have accounts. Not sending an invite "
+            "email".format(", ".join(already_setup))
         )
-    else:
-        if not user.is_setup():
-            send_invite(request, user)
-            messages.add_message(
-                request,
-                messages.INFO,
-                "User {} has an account but hasn't set it up yet. Re-sending "
-                "a new invite".format(email)
-            )
-        else:
-            messages.add_message(
-                request,
-                messages.INFO,
-                "User {} already has an account. Not sending an invite "
-                "email".format(email)
-            )
 
-    return user
+    return {email: users[email.lower()] for email in emails}
 
 
-def send_invite(request, user):
-    """Sends an invite to the specified user"""
+def unique_usernames(emails):
+    """Returns a dict mapping each email to an unused username for it
+
+    Usernames are unique on the default user model, so new users can't all
+    be left with a blank one. Each gets its lowercased email, with a number
+    appended if another user already has that username.
+    """
+    max_length = models.User._meta.get_field('username').max_length
+    wanted = {email: email.lower()[:max_length] for email in emails}
+    taken = set(
+        models.User.objects.filter(username__in=wanted.values())
+        .values_list('username', flat=True)
+    )
+
+    usernames = {}
+    for email, username in wanted.items():
+        candidate = username
+        number = 1
+        while candidate in taken:
+            number += 1
+            suffix = "-{}".format(number)
+            candidate = username[:max_length - len(suffix)] + suffix
+        taken.add(candidate)
+        usernames[email] = candidate
+    return usernames
+
+
+def build_invite(request, user, site=None):
+    """Returns the invite email for the specified user, ready to send"""
     token = signing.dumps(user.id, salt=SALT)
 
     context = {
@@ -89,7 +164,7 @@ def send_invite(request, user):
             reverse('invite_accept', kwargs={'token': token})
         ),
         'expiration_days': ACCOUNT_ACTIVATION_DAYS,
-        'site': get_current_site(request),
+        'site': site or get_current_site(request),
     }
 
     subject = render_to_string('invite_subject.txt', context)
@@ -99,13 +174,17 @@ def send_invite(request, user):
 
     body = render_to_string('invite_body.txt', context).strip()
 
-    msg = EmailMultiAlternatives(
+    return EmailMultiAlternatives(
         subject,
         body,
         from_email,
         [user.email]
     )
-    msg.send()
+
+
+def send_invite(request, user):
+    """Sends an invite to the specified user"""
+    build_invite(request, user).send()
 
 
 def get_user_from_token(token):
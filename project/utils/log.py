@@ -0,0 +1,137 @@
+"""Logging helpers
+
+configure() is used as LOGGING_CONFIG. It applies the LOGGING dict as usual,
+then moves the handlers listed under its "queue_handlers" key behind a
+QueueHandler, so request threads only put records on a queue. A
+QueueListener thread per handler does the formatting and I/O.
+
+ThrottledAdminEmailHandler replaces Django's AdminEmailHandler so that an
+error storm produces one email per distinct error rather than one per
+request.
+"""
+
+import atexit
+import copy
+import logging
+import logging.config
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from django.utils.log import AdminEmailHandler
+
+_listeners = []
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    Records stay in this process, so unlike QueueHandler this passes them on
+    untouched. AdminEmailHandler needs the request and exc_info.
+    """
+
+    def prepare(self, record):
+        return copy.copy(record)
+
+
+def stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()
+
+
+def configure(config):
+    config = dict(config)
+    queued = config.pop('queue_handlers', [])
+    stop_listeners()
+    logging.config.dictConfig(config)
+
+    loggers = [logging.getLogger()] + [
+        logger for logger in logging.Logger.manager.loggerDict.values()
+        if isinstance(logger, logging.Logger)
+    ]
+    replacements = {}
+    for logger in loggers:
+        for i, handler in enumerate(logger.handlers):
+            if handler.name not in queued:
+                continue
+            if handler not in replacements:
+                queue_handler = LocalQueueHandler(queue.SimpleQueue())
+                queue_handler.name = handler.name
+                listener = QueueListener(
+                    queue_handler.queue, handler, respect_handler_level=True,
+                )
+                listener.start()
+                _listeners.append(listener)
+                replacements[handler] = queue_handler
+            logger.handlers[i] = replacements[handler]
+
+
+# Flush what's queued on the way out
+atexit.register(stop_listeners)
+
+
+class ThrottledAdminEmailHandler(AdminEmailHandler):
+    """
+    Mails the admins about the first occurrence of each error, then holds
+    back repeats of the same error for ``interval`` seconds. Errors are
+    the same if they have the same exception type and raising line, or for
+    errors without one, the same logger and message template.
+
+    The next email about an error says how many were held back, and any
+    still held back are summarized when the handler is closed.
+    """
+
+    def __init__(self, include_html=False, email_backend=None,
+                 reporter_class=None, interval=300):
+        super().__init__(include_html, email_backend, reporter_class)
+        self.interval = interval
+        # Signature to [time last mailed, occurrences held back since]
+        self.seen = {}
+        self.suppressed = 0
+
+    def get_signature(self, record):
+        if record.exc_info and record.exc_info[2] is not None:
+            exc_type, _, tb = record.exc_info
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            return (exc_type, tb.tb_frame.f_code.co_filename, tb.tb_lineno)
+        return (record.name, str(record.msg))
+
+    def emit(self, record):
+        # Handler.handle() holds the handler's lock while this runs
+        signature = self.get_signature(record)
+        now = time.monotonic()
+        entry = self.seen.get(signature)
+        if entry is not None and now - entry[0] < self.interval:
+            entry[1] += 1
+            return
+        self.suppressed = entry[1] if entry else 0
+        self.seen[signature] = [now, 0]
+        # Forget errors that haven't come up in a while
+        if len(self.seen) > 1000:
+            self.seen = {
+                key: value for key, value in self.seen.items()
+                if now - value[0] < self.interval or value[1]
+            }
+        super().emit(record)
+
+    def format_subject(self, subject):
+        subject = super().format_subject(subject)
+        if self.suppressed:
+            subject = f'{subject} (+{self.suppressed} similar)'
+        return subject
+
+    def close(self):
+        with self.lock:
+            held = sum(count for _, count in self.seen.values())
+            self.seen = {}
+        if held:
+            try:
+                self.send_mail(
+                    f'{held} errors were not mailed individually',
+                    f'{held} repeats of errors already reported were held '
+                    f'back by {type(self).__name__}. See the logs for details.',
+                    fail_silently=True,
+                )
+            except Exception:
+                pass
+        super().close()
@@ -0,0 +1,222 @@
+"""Outbox for transactional email
+
+With EMAIL_BACKEND set to "project.utils.mail.OutboxBackend", sending an
+email only saves it to the OutboxMessage table, in the same transaction as
+the view's other writes. The drain_outbox management command then delivers
+queued messages with OUTBOX_DELIVERY_BACKEND (SMTP by default), so a slow
+mail server never holds up a request. A message rolled back with its
+transaction is never sent.
+
+Failed deliveries are retried with exponential backoff, up to
+OUTBOX_MAX_ATTEMPTS times. For local testing, set OUTBOX_DELIVERY_BACKEND to
+the console or file backend.
+"""
+
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+DEFAULT_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+DEFAULT_MAX_ATTEMPTS = 5
+# Delay before the first retry, doubled for each attempt after that
+DEFAULT_RETRY_DELAY = 60
+MAX_RETRY_DELAY = 60 * 60 * 6
+# How long a drain has to deliver the batch it claimed before other drains
+# may retry it, in case it died halfway
+CLAIM_TIMEOUT = 60 * 10
+
+
+def encode(content):
+    if isinstance(content, bytes):
+        return {'base64': base64.b64encode(content).decode('ascii')}
+    return content
+
+
+def decode(content):
+    if isinstance(content, dict):
+        return base64.b64decode(content['base64'])
+    return content
+
+
+def serialize(message):
+    """
+    Returns ``message`` as a JSON serializable dict.
+    """
+    attachments = []
+    for attachment in message.attachments:
+        if not isinstance(attachment, tuple):
+            # A MIMEBase instance
+            attachment = (None, attachment.as_bytes(), 'message/rfc822')
+        filename, content, mimetype = attachment
+        attachments.append([filename, encode(content), mimetype])
+
+    return {
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'attachments': attachments,
+        'content_subtype': message.content_subtype,
+    }
+
+
+def deserialize(data):
+    message = EmailMultiAlternatives(
+        subject=data['subject'],
+        body=data['body'],
+        from_email=data['from_email'],
+        to=data['to'],
+        cc=data['cc'],
+        bcc=data['bcc'],
+        reply_to=data['reply_to'],
+        headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']],
+    )
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, decode(content), mimetype)
+    message.content_subtype = data['content_subtype']
+    return message
+
+
+class OutboxBackend(BaseEmailBackend):
+    """
+    Queues messages in the outbox instead of sending them.
+    """
+
+    def send_messages(self, email_messages):
+        messages = [
+            OutboxMessage(
+                data=serialize(message),
+                recipients=', '.join(message.recipients()),
+                subject=message.subject[:255],
+            )
+            for message in email_messages
+            if message.recipients()
+        ]
+        try:
+            OutboxMessage.objects.bulk_create(messages)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(messages)
+
+
+class Deliverer:
+    """
+    Sends messages with OUTBOX_DELIVERY_BACKEND from a pool of threads, each
+    holding its own open connection.
+    """
+
+    def __init__(self, workers):
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def get_connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            backend = getattr(settings, 'OUTBOX_DELIVERY_BACKEND', DEFAULT_DELIVERY_BACKEND)
+            connection = get_connection(backend)
+            connection.open()
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def send(self, data):
+        """
+        Returns None once sent, or the error.
+        """
+        try:
+            message = deserialize(data)
+            message.connection = self.get_connection()
+            message.send()
+        except Exception as e:
+            # Start afresh on the next message in case the connection broke
+            connection = getattr(self.local, 'connection', None)
+            if connection is not None:
+                self.local.connection = None
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            return f'{type(e).__name__}: {e}'
+        return None
+
+    def map(self, messages):
+        return self.executor.map(self.send, [message.data for message in messages])
+
+    def close(self):
+        self.executor.shutdown()
+        for connection in self.connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+
+def get_retry_delay(attempts):
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', DEFAULT_RETRY_DELAY)
+    return timedelta(seconds=min(MAX_RETRY_DELAY, base * 2 ** (attempts - 1)))
+
+
+def drain(deliverer, batch_size=100):
+    """
+    Delivers up to ``batch_size`` due messages. Returns the number of
+    messages sent and failed.
+
+    The batch is claimed in a short transaction, by counting the attempt and
+    pushing its send_after past CLAIM_TIMEOUT, and delivered outside it, so
+    no rows stay locked while the mail server is slow. Other workers skip
+    claimed rows, so several can drain the outbox at once.
+    """
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    sent = failed = 0
+
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.due()
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        OutboxMessage.objects.filter(
+            pk__in=[message.pk for message in messages],
+        ).update(
+            attempts=F('attempts') + 1,
+            send_after=timezone.now() + timedelta(seconds=CLAIM_TIMEOUT),
+        )
+
+    for message, error in zip(messages, deliverer.map(messages)):
+        message.attempts += 1
+        if error is None:
+            message.sent = timezone.now()
+            message.last_error = ''
+            sent += 1
+        else:
+            message.last_error = error
+            message.failed = message.attempts >= max_attempts
+            message.send_after = timezone.now() + get_retry_delay(message.attempts)
+            failed += 1
+
+    # The attempts were counted when claiming
+    OutboxMessage.objects.bulk_update(
+        messages, ['sent', 'last_error', 'failed', 'send_after'],
+    )
+
+    return sent, failed
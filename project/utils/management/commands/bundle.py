@@ -1,17 +1,42 @@
 # -*- coding: utf-8 -*-
 
+import compileall
+import hashlib
+import json
 import os
+import py_compile
 import re
+import shutil
+import stat
 import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from distutils.util import get_platform
 from subprocess import (
-    PIPE, CalledProcessError, Popen, check_call, check_output,
+    PIPE, STDOUT, CalledProcessError, Popen, check_call, check_output, run,
 )
-from tempfile import mkdtemp
+from tempfile import TemporaryDirectory, mkdtemp
 
 from django.core.management.base import BaseCommand, CommandError
 
+from project.utils import importtime
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'bundle')
+
+# A requirement pinned to one exact version, e.g. "django==3.1.3"
+PINNED = re.compile(r'^[\w.-]+(\[[\w.,\s-]*\])?\s*===?\s*[\w.+!-]+\s*(;.*)?$')
+
+# Where --prebuilt bundles have their dependencies installed and static
+# files collected, relative to the bundle
+SITE_PACKAGES = 'site-packages'
+STATIC_ROOT = 'staticfiles'
+
+# Archive members that are compressed already
+COMPRESSED = ('.whl', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.png', '.jpg', '.woff2')
+
 
 class StepFail(BaseException):
     """
@@ -20,6 +45,211 @@ class StepFail(BaseException):
     """
 
 
+def read_requirements(path):
+    """
+    Returns the option lines (e.g. --index-url) and requirement lines of a
+    requirements file, without comments.
+    """
+    with open(path) as f:
+        text = f.read().replace('\\\n', ' ')
+    options, requirements = [], []
+    for line in text.splitlines():
+        line = re.sub(r'(^|\s)#.*$', '', line).strip()
+        if not line:
+            continue
+        (options if line.startswith('-') else requirements).append(line)
+    return options, requirements
+
+
+def sha256sum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class WheelCache:
+    """
+    Downloaded distributions, stored under ``blobs/`` by the SHA-256 of
+    their content. ``index/`` maps each pinned requirement line, for a
+    platform and Python version, to the blob it downloaded, so a pin is only
+    ever downloaded once. Unpinned requirements are downloaded every time,
+    as the version they resolve to can change.
+    """
+
+    def __init__(self, root, platform, options):
+        self.root = root
+        self.platform = platform
+        self.options = options
+
+    def get_key(self, requirement):
+        data = json.dumps([
+            requirement, self.platform, sys.version_info[:2], self.options,
+        ])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get_index_path(self, requirement):
+        key = self.get_key(requirement)
+        return os.path.join(self.root, 'index', key[:2], f'{key}.json')
+
+    def get_blob_path(self, digest, filename):
+        return os.path.join(self.root, 'blobs', digest[:2], digest, filename)
+
+    def is_pinned(self, requirement):
+        # Drop per-requirement options, e.g. --hash
+        return bool(PINNED.match(requirement.split(' -')[0].strip()))
+
+    def get(self, requirement):
+        """
+        Returns the path of the cached download for ``requirement``, if any.
+        """
+        if not self.is_pinned(requirement):
+            return None
+        try:
+            with open(self.get_index_path(requirement)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        path = self.get_blob_path(entry['sha256'], entry['filename'])
+        return path if os.path.exists(path) else None
+
+    def add(self, requirement, path):
+        digest = sha256sum(path)
+        filename = os.path.basename(path)
+        blob = self.get_blob_path(digest, filename)
+        if not os.path.exists(blob):
+            with open(path, 'rb') as f:
+                write_atomic(blob, f.read())
+        if self.is_pinned(requirement):
+            write_atomic(self.get_index_path(requirement), json.dumps({
+                'requirement': requirement,
+                'filename': filename,
+                'sha256': digest,
+            }).encode())
+        return blob
+
+    def download(self, requirement):
+        """
+        Downloads ``requirement`` into the cache and returns its path.
+        """
+        with TemporaryDirectory() as tmp:
+            # A requirements file keeps the line's own options, e.g. --hash
+            requirements = os.path.join(tmp, 'requirements.txt')
+            with open(requirements, 'w') as f:
+                f.write('\n'.join(self.options + [requirement]) + '\n')
+            dest = os.path.join(tmp, 'download')
+            args = [
+                sys.executable, '-m', 'pip', 'download',
+                '--no-deps', '--disable-pip-version-check', '--quiet',
+                '-r', requirements,
+                '-d', dest,
+            ]
+            if self.platform:
+                args.extend(['--platform', self.platform])
+            result = run(args, stdout=PIPE, stderr=STDOUT)
+            if result.returncode != 0:
+                raise StepFail(
+                    f'Could not download {requirement}:\n'
+                    f'{result.stdout.decode(errors="replace")}'
+                )
+            (filename,) = os.listdir(dest)
+            return self.add(requirement, os.path.join(dest, filename))
+
+    def fetch(self, requirements, dest, jobs):
+        """
+        Puts the distribution for each requirement in ``dest``, downloading
+        those not cached ``jobs`` at a time. Returns the number that were
+        cached and downloaded.
+        """
+        paths = {requirement: self.get(requirement) for requirement in requirements}
+        missing = [requirement for requirement, path in paths.items() if path is None]
+        with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            paths.update(zip(missing, executor.map(self.download, missing)))
+
+        os.makedirs(dest, exist_ok=True)
+        for path in paths.values():
+            target = os.path.join(dest, os.path.basename(path))
+            try:
+                os.link(path, target)
+            except OSError:
+                shutil.copyfile(path, target)
+        return len(paths) - len(missing), len(missing)
+
+
+def iter_tree(root):
+    """
+    Yields the archive name and path of everything under ``root``, in a
+    stable order.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(dirnames + filenames):
+            path = os.path.join(dirpath, name)
+            yield os.path.relpath(path, root).replace(os.sep, '/'), path
+
+
+def normalize_mode(st):
+    if stat.S_ISDIR(st.st_mode) or st.st_mode & 0o111:
+        return 0o755
+    return 0o644
+
+
+def write_tar(fileobj, root, mtime):
+    """
+    Writes ``root`` to ``fileobj`` as a tar stream with normalized
+    ownership, permissions and times, so the same tree makes the same bytes.
+    """
+    with tarfile.open(fileobj=fileobj, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        for name, path in iter_tree(root):
+            info = tar.gettarinfo(path, arcname=name)
+            info.mode = normalize_mode(os.lstat(path))
+            info.mtime = mtime
+            info.uid = info.gid = 0
+            info.uname = info.gname = ''
+            if info.isreg():
+                with open(path, 'rb') as f:
+                    tar.addfile(info, f)
+            else:
+                tar.addfile(info)
+
+
+def write_zip(fileobj, root, mtime):
+    """
+    Like write_tar, for zip. Members that are compressed already are stored.
+    """
+    # Zip can't represent times before 1980
+    date_time = max(time.gmtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
+    with zipfile.ZipFile(fileobj, 'w') as archive:
+        for name, path in iter_tree(root):
+            st = os.lstat(path)
+            mode = normalize_mode(st)
+            if stat.S_ISDIR(st.st_mode):
+                info = zipfile.ZipInfo(f'{name}/', date_time)
+                info.external_attr = (stat.S_IFDIR | mode) << 16 | 0x10
+                archive.writestr(info, b'')
+            elif stat.S_ISLNK(st.st_mode):
+                info = zipfile.ZipInfo(name, date_time)
+                info.external_attr = (stat.S_IFLNK | 0o777) << 16
+                archive.writestr(info, os.readlink(path))
+            else:
+                info = zipfile.ZipInfo(name, date_time)
+                info.external_attr = (stat.S_IFREG | mode) << 16
+                info.file_size = st.st_size
+                if not name.endswith(COMPRESSED):
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, 'rb') as src, archive.open(info, 'w') as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+
+
 class Command(BaseCommand):
     help = 'Build/bundle the application for deployment to production.'
 
@@ -37,6 +267,23 @@ class Command(BaseCommand):
             help="The platform to use when downloading wheel dependencies. "
                  "e.g. 'linux_ppc64le'"
         )
+        parser.add_argument(
+            '--cache-dir', default=DEFAULT_CACHE_DIR,
+            help='Where downloaded dependencies are kept between builds. '
+                 f'Defaults to {DEFAULT_CACHE_DIR}.',
+        )
+        parser.add_argument(
+            '-j', '--jobs', type=int, default=8,
+            help='Number of dependencies downloaded in parallel.',
+        )
+        parser.add_argument(
+            '--prebuilt', action='store_true',
+            help='Make the bundle ready to run: install the dependencies in '
+                 f'{SITE_PACKAGES}/, collect static files in {STATIC_ROOT}/ and '
+                 'compile all Python files, then time importing project.wsgi. '
+                 'Needs the production environment variables, and the same '
+                 'Python version as production.',
+        )
         parser.add_argument(
             'branch',
             help='Git ref to bundle, e.g. a branch or commit hash.',
@@ -72,7 +319,7 @@ class Command(BaseCommand):
             sys.exit(1)
         self.stderr.write(self.style.SUCCESS(success))
 
-    def stream(self, args, cwd=None, check=True, quiet=False):
+    def stream(self, args, cwd=None, check=True, quiet=False, env=None):
         """
         Stream the output of the subprocess
         """
@@ -86,7 +333,7 @@ class Command(BaseCommand):
             extra = {}
 
         try:
-            process = Popen(args, cwd=cwd, **extra)
+            process = Popen(args, cwd=cwd, env=env, **extra)
             process.wait()
 
             if check and process.returncode != 0:
@@ -96,11 +343,78 @@ class Command(BaseCommand):
             sys.stderr.write("\x1b8")  # Restore cursor pos
             sys.stderr.flush()
 
+    def prebuild(self, tmp, platform):
+        site_packages = os.path.join(tmp, SITE_PACKAGES)
+        dependencies = os.path.join(tmp, 'dependencies')
+        # Dependencies built for another platform can't run here, so Django
+        # runs from this environment's packages instead
+        path = [tmp] if platform else [tmp, site_packages]
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE='project.deploy.settings',
+            STATIC_ROOT=STATIC_ROOT,
+            PYTHONPATH=os.pathsep.join(path),
+            PYTHONDONTWRITEBYTECODE='1',
+        )
+
+        with self.step('Installing dependencies...'):
+            args = [
+                sys.executable, '-m', 'pip', 'install',
+                '--no-deps', '--no-index', '--disable-pip-version-check',
+                '--target', site_packages,
+            ]
+            if platform:
+                args.extend(['--platform', platform, '--only-binary=:all:'])
+            args.extend(
+                os.path.join(dependencies, name)
+                for name in sorted(os.listdir(dependencies))
+            )
+            self.stream(args, quiet=True)
+
+        with self.step('Collecting static files...'):
+            self.stream(
+                [sys.executable, '-m', 'django', 'collectstatic', '--noinput'],
+                cwd=tmp, env=env, quiet=True,
+            )
+
+        with self.step('Compiling Python files...'):
+            # Archive members get the commit's time, so timestamp based .pyc
+            # files would look stale once extracted
+            compiled = compileall.compile_dir(
+                tmp, quiet=2, workers=0,
+                invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+            )
+            if not compiled:
+                self.stderr.write('(some files could not be compiled) ', ending='')
+
+        with self.step('Timing import of project.wsgi...'):
+            try:
+                profile = importtime.measure(
+                    'project.wsgi', path=path, env=env, cwd=tmp,
+                )
+            except importtime.ImportFailed as e:
+                raise StepFail(f'Could not import project.wsgi:\n{e}') from e
+            slowest = sorted(
+                profile.imports, key=lambda i: i.self_us, reverse=True,
+            )[:20]
+            with open(os.path.join(tmp, 'startup.json'), 'w') as f:
+                json.dump({
+                    'module': 'project.wsgi',
+                    'seconds': round(profile.seconds, 3),
+                    'slowest': [
+                        {'module': i.name, 'self_ms': i.self_us / 1000}
+                        for i in slowest
+                    ],
+                }, f, indent=2)
+            self.stderr.write(f'({profile.seconds:.2f}s) ', ending='')
+
     def handle(self, *args, **options):
         self.check_uncommitted()
 
         ref = options['branch']
         sha = check_output(['git', 'rev-parse', ref]).decode('ASCII').strip()
+        # Archive members get the commit's time, so rebuilds are identical
+        mtime = int(check_output(['git', 'show', '-s', '--format=%ct', sha]))
         ext = 'tar' if options['tar'] else 'zip'
 
         tmp = mkdtemp()  # build directory
@@ -114,20 +428,23 @@ class Command(BaseCommand):
         if not out:
             out = f'bundles/build-{ref}-{sha[:8]}-{platform_name}.{ext}'
 
-        # Both zip and tar accept `-` to mean standard out
+        # `-` means standard out
         if out != '-':
             out = os.path.abspath(out)
 
             # ensure output directory
-            check_call(['mkdir', '-p', os.path.dirname(out)])
+            os.makedirs(os.path.dirname(out), exist_ok=True)
 
         msg = f'Creating application bundle for: {ref}'
         self.stderr.write(self.style.MIGRATE_HEADING(msg))
 
         # copy the project to archive directory
         with self.step('Creating build directory at {} ...'.format(tmp)):
-            archive = Popen(['git',  'archive', ref], stdout=PIPE)
-            check_call(['tar', '-x', '-C', tmp], stdin=archive.stdout)
+            archive = Popen(['git', 'archive', '--format=tar', sha], stdout=PIPE)
+            # The archive comes from our own repository, so extract it as is
+            extra = {'filter': 'fully_trusted'} if hasattr(tarfile, 'data_filter') else {}
+            with tarfile.open(fileobj=archive.stdout, mode='r|') as tar:
+                tar.extractall(tmp, **extra)
             archive.stdout.close()
             archive.wait()
             if archive.returncode > 0:
@@ -153,26 +470,30 @@ class Command(BaseCommand):
         else:
             self.stderr.write('  - No \'package.json\' found. Skipping javascript build.')
 
-        # Gather dependencies
+        # Gather dependencies, from the cache where possible
         with self.step("Gathering dependencies"):
-            args = [
-                'pip', 'download',
-                '--no-deps',
-                '-r', 'requirements.txt',
-                '-d', os.path.join(tmp, 'dependencies'),
-            ]
-            if platform:
-                args.extend([
-                    '--platform', platform,
-                ])
-            self.stream(args, quiet=True)
+            pip_options, requirements = read_requirements(
+                os.path.join(tmp, 'requirements.txt'),
+            )
+            cache = WheelCache(options['cache_dir'], platform, pip_options)
+            cached, downloaded = cache.fetch(
+                requirements, os.path.join(tmp, 'dependencies'), options['jobs'],
+            )
+            self.stderr.write(f'({cached} cached, {downloaded} downloaded) ', ending='')
+
+        if options['prebuilt']:
+            self.prebuild(tmp, platform)
 
-        # Create zip archive
+        # Create the archive
         with self.step('Writing bundle...'):
-            if options['tar']:
-                self.stream(['tar', 'cvf', out, '.'], cwd=tmp)
+            write = write_tar if options['tar'] else write_zip
+            if out == '-':
+                write(sys.stdout.buffer, tmp, mtime)
             else:
-                self.stream(['zip', '-r', out, '.'], cwd=tmp)
+                partial = f'{out}.partial'
+                with open(partial, 'wb') as f:
+                    write(f, tmp, mtime)
+                os.replace(partial, out)
         self.stderr.write('')
 
         if os.path.exists('.elasticbeanstalk/config.yml'):
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from project.utils import mail
+
+
+class Command(BaseCommand):
+    help = 'Deliver emails queued in the outbox. See project.utils.mail.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-w', '--workers', type=int, default=4,
+            help='Number of messages delivered in parallel.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of messages claimed at a time.',
+        )
+        parser.add_argument(
+            '--forever', action='store_true',
+            help='Keep polling for new messages instead of exiting once the '
+                 'outbox is empty.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to wait between polls with --forever.',
+        )
+
+    def handle(self, *args, **options):
+        deliverer = mail.Deliverer(options['workers'])
+        try:
+            while True:
+                sent, failed = mail.drain(deliverer, options['batch_size'])
+                if sent or failed:
+                    self.stderr.write(f'Sent {sent} messages, {failed} failed')
+                elif not options['forever']:
+                    break
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            deliverer.close()
@@ -0,0 +1,172 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from project.utils import importtime
+
+
+class Command(BaseCommand):
+    help = 'Profile process startup: how long importing project.wsgi takes, ' \
+           'as a tree of module import times, and how long each app takes ' \
+           'to load. manage.py loads the same settings and apps.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--module', default='project.wsgi',
+            help='Module to import, e.g. project.asgi.',
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Number of times to start Python. The fastest run is reported.',
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=5,
+            help='Leave imports faster than this many milliseconds out of the tree.',
+        )
+        parser.add_argument(
+            '--heavy', type=float, default=10,
+            help='Flag imports made by project code that take longer than '
+                 'this many milliseconds.',
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON file of a previous profile. The command fails if '
+                 'startup got slower than it by more than --tolerance.',
+        )
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Write this profile to --baseline instead of checking it.',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Fraction startup may get slower than the baseline by.',
+        )
+
+    def get_local_packages(self):
+        return {
+            name for name in os.listdir(settings.BASE_DIR)
+            if os.path.exists(os.path.join(settings.BASE_DIR, name, '__init__.py'))
+        }
+
+    def write_tree(self, nodes, threshold, depth=0):
+        for node in nodes:
+            if node.cumulative_us < threshold:
+                continue
+            self.stdout.write(
+                f'{node.cumulative_us / 1000:9.1f} {node.self_us / 1000:9.1f}  '
+                f'{"  " * depth}{node.name}'
+            )
+            self.write_tree(node.children, threshold, depth + 1)
+
+    def find_heavy(self, nodes, local, heavy, parent=None):
+        """
+        Yields the heavy imports that local modules make of non-local,
+        non-Django modules, with the module importing them.
+        """
+        for node in nodes:
+            package = node.name.split('.')[0]
+            if (
+                parent is not None and parent.split('.')[0] in local
+                and package not in local and package != 'django'
+                and node.cumulative_us >= heavy
+            ):
+                yield node, parent
+            yield from self.find_heavy(node.children, local, heavy, node.name)
+
+    def handle(self, *args, **options):
+        if options['update_baseline'] and not options['baseline']:
+            raise CommandError('--update-baseline needs --baseline to say where to write it.')
+
+        profiles = []
+        for _ in range(max(options['repeat'], 1)):
+            try:
+                profiles.append(importtime.measure(
+                    options['module'], path=[settings.BASE_DIR],
+                    cwd=settings.BASE_DIR, write_bytecode=True,
+                ))
+            except importtime.ImportFailed as e:
+                raise CommandError(f"Could not import {options['module']}:\n{e}")
+        profile = min(profiles, key=lambda p: p.seconds)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Imports (ms), {options['threshold']:g}ms and over:"
+        ))
+        self.stdout.write(f'{"total":>9} {"self":>9}  module')
+        self.write_tree(
+            importtime.build_tree(profile.imports), options['threshold'] * 1000,
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Apps (ms):'))
+        self.stdout.write(f'{"import":>9} {"models":>9} {"ready":>9}  app')
+        for app in profile.apps:
+            self.stdout.write(
+                f'{app.import_s * 1000:9.1f} {app.models_s * 1000:9.1f} '
+                f'{app.ready_s * 1000:9.1f}  {app.name}'
+            )
+
+        heavy = list(self.find_heavy(
+            importtime.build_tree(profile.imports), self.get_local_packages(),
+            options['heavy'] * 1000,
+        ))
+        if heavy:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                'Heavy imports that could be deferred to where they are used:'
+            ))
+            for node, parent in heavy:
+                self.stdout.write(self.style.WARNING(
+                    f'  {node.name} ({node.cumulative_us / 1000:.1f}ms), '
+                    f'first imported by {parent}'
+                ))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Importing {options['module']} took {profile.seconds * 1000:.1f}ms"
+        ))
+
+        if options['baseline']:
+            self.check_baseline(profile, options)
+
+    def check_baseline(self, profile, options):
+        path = options['baseline']
+        apps = {
+            app.label: round(app.import_s + app.models_s + app.ready_s, 4)
+            for app in profile.apps
+        }
+        if options['update_baseline']:
+            with open(path, 'w') as f:
+                json.dump({
+                    'module': options['module'],
+                    'seconds': round(profile.seconds, 4),
+                    'apps': apps,
+                }, f, indent=2, sort_keys=True)
+            self.stderr.write(self.style.SUCCESS(f'Wrote baseline to {path}'))
+            return
+
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            raise CommandError(
+                f'No baseline at {path}. Create it with --update-baseline.'
+            )
+
+        limit = 1 + options['tolerance']
+        for label, seconds in apps.items():
+            previous = baseline['apps'].get(label)
+            # Ignore noise in apps that take next to no time
+            if previous is not None and seconds > max(previous * limit, previous + 0.005):
+                self.stderr.write(self.style.WARNING(
+                    f'{label} loads in {seconds * 1000:.1f}ms, '
+                    f'up from {previous * 1000:.1f}ms'
+                ))
+        if profile.seconds > baseline['seconds'] * limit:
+            raise CommandError(
+                f'Startup took {profile.seconds * 1000:.1f}ms, more than '
+                f"{options['tolerance']:.0%} over the baseline of "
+                f"{baseline['seconds'] * 1000:.1f}ms"
+            )
+        self.stderr.write(self.style.SUCCESS(
+            f"Within {options['tolerance']:.0%} of the baseline of "
+            f"{baseline['seconds'] * 1000:.1f}ms"
+        ))
@@ -0,0 +1,181 @@
+"""Request metrics
+
+MetricsMiddleware records, for each route (the URL pattern name), request
+latency, number of SQL queries and time spent in the database. The metrics
+view serves them in the Prometheus text format at /metrics, to INTERNAL_IPS
+and staff users only.
+
+Metrics are kept in memory per process. With several worker processes each
+scrape only sees the worker that answered it, so label or aggregate
+accordingly, e.g. by scraping each worker's port.
+"""
+
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    __slots__ = ['buckets', 'counts', 'sum', 'count']
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # One more for observations above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RouteMetrics:
+    __slots__ = ['latency', 'queries', 'db_time', 'responses']
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = 0.0
+        # Status class, e.g. "2xx", to count
+        self.responses = {}
+
+
+class Registry:
+
+    def __init__(self):
+        self.routes = {}
+        self.lock = threading.Lock()
+
+    def record(self, route, status, latency, queries, db_time):
+        status = f'{status // 100}xx'
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = RouteMetrics()
+            metrics.latency.observe(latency)
+            metrics.queries.observe(queries)
+            metrics.db_time += db_time
+            metrics.responses[status] = metrics.responses.get(status, 0) + 1
+
+    def render(self):
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = [
+                '# HELP http_requests_total Responses by route and status class.',
+                '# TYPE http_requests_total counter',
+            ]
+            for route, metrics in routes:
+                for status, count in sorted(metrics.responses.items()):
+                    lines.append(
+                        f'http_requests_total{{route="{route}",status="{status}"}} {count}'
+                    )
+
+            lines += [
+                '# HELP http_request_duration_seconds Request latency by route.',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for route, metrics in routes:
+                lines.extend(metrics.latency.samples(
+                    'http_request_duration_seconds', f'route="{route}"',
+                ))
+
+            lines += [
+                '# HELP http_request_db_queries SQL queries per request by route.',
+                '# TYPE http_request_db_queries histogram',
+            ]
+            for route, metrics in routes:
+                lines.extend(metrics.queries.samples(
+                    'http_request_db_queries', f'route="{route}"',
+                ))
+
+            lines += [
+                '# HELP http_request_db_seconds_total Time spent in SQL queries by route.',
+                '# TYPE http_request_db_seconds_total counter',
+            ]
+            for route, metrics in routes:
+                lines.append(
+                    f'http_request_db_seconds_total{{route="{route}"}} {metrics.db_time}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """
+    A database execute wrapper counting queries and the time they take.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += perf_counter() - start
+            self.count += 1
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # Label values can't contain quotes, so stick to the pattern name
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        latency = perf_counter() - start
+
+        registry.record(
+            get_route(request), response.status_code, latency,
+            timer.count, timer.time,
+        )
+        return response
+
+
+def metrics(request):
+    allowed = (
+        request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        or request.user.is_staff
+    )
+    if not allowed:
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
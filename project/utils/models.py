@@ -1,7 +1,51 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
+from django.utils import timezone
 
 
 # For more information, read:
 # https://docs.djangoproject.com/en/2.1/topics/auth/customizing/#using-a-custom-user-model-when-starting-a-project
 class User(AbstractUser):
     pass
+
+
+class OutboxMessageQuerySet(models.QuerySet):
+
+    def due(self):
+        """
+        Unsent messages ready for another delivery attempt, oldest first.
+        """
+        return self.filter(
+            sent__isnull=True, failed=False, send_after__lte=timezone.now(),
+        ).order_by('send_after', 'pk')
+
+
+class OutboxMessage(models.Model):
+    """
+    An email waiting to be delivered by the drain_outbox command. See
+    project.utils.mail.
+    """
+    # The serialized EmailMessage
+    data = models.JSONField()
+    recipients = models.TextField(blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+    # Set once a message has run out of attempts
+    failed = models.BooleanField(default=False)
+
+    objects = OutboxMessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['send_after'], name='utils_outbox_due',
+                condition=models.Q(sent__isnull=True, failed=False),
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.recipients}'
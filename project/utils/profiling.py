@@ -0,0 +1,162 @@
+"""On-demand request profiling
+
+Staff users can profile a single request by adding ``?profile=1`` to its URL
+or sending an ``X-Profile`` header. ProfilerMiddleware then samples the
+request thread's stack every PROFILER_INTERVAL seconds (2ms by default)
+from a background thread, and times every SQL query. Nothing is sampled for
+other requests, so the cost is only paid when asked for.
+
+Two files are saved to the default storage under ``profiles/``, i.e. in
+MEDIA_ROOT:
+
+- ``<name>.collapsed``: one line per distinct stack, root first, with its
+  sample count. Open it in speedscope (https://www.speedscope.app) or feed
+  it to flamegraph.pl.
+- ``<name>.sql.json``: the SQL timeline, each query's start offset and
+  duration in milliseconds and its SQL.
+
+The response's X-Profile header has the name of the collapsed stack file.
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+DEFAULT_INTERVAL = 0.002
+
+
+def frame_label(code):
+    filename = code.co_filename
+    if filename.startswith(settings.BASE_DIR):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    # Semicolons separate frames in the collapsed format
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class Sampler:
+    """
+    Samples the stack of the thread that created it until stopped.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        # Labels by code object, as building them is the costly part
+        self.labels = {}
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = self.labels.get(code)
+                if label is None:
+                    label = self.labels[code] = frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(
+            f"{';'.join(stack)} {count}\n"
+            for stack, count in self.stacks.most_common()
+        )
+
+
+class QueryTimeline:
+    """
+    A database execute wrapper recording when each query ran.
+    """
+
+    def __init__(self, start):
+        self.start = start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            end = perf_counter()
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'start_ms': round((start - self.start) * 1000, 3),
+                'duration_ms': round((end - start) * 1000, 3),
+                'sql': sql,
+                'many': many,
+            })
+
+
+class ProfilerMiddleware:
+    """
+    Must come after AuthenticationMiddleware, as only staff can profile.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        wanted = 'profile' in request.GET or 'HTTP_X_PROFILE' in request.META
+        return wanted and request.user.is_staff
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        start = perf_counter()
+        timeline = QueryTimeline(start)
+        sampler = Sampler(getattr(settings, 'PROFILER_INTERVAL', DEFAULT_INTERVAL))
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timeline))
+            sampler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                sampler.stop()
+        elapsed = perf_counter() - start
+
+        name = self.save(request, sampler, timeline, elapsed)
+        response['X-Profile'] = name
+        return response
+
+    def save(self, request, sampler, timeline, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match and match.view_name else 'request'
+        stamp = timezone.now().strftime('%Y%m%d-%H%M%S-%f')
+        base = f"profiles/{stamp}-{route.replace(':', '-')}"
+
+        name = default_storage.save(
+            f'{base}.collapsed', ContentFile(sampler.collapsed().encode()),
+        )
+        default_storage.save(f'{base}.sql.json', ContentFile(json.dumps({
+            'path': request.get_full_path(),
+            'duration_ms': round(elapsed * 1000, 3),
+            'samples': sum(sampler.stacks.values()),
+            'queries': timeline.queries,
+        }, indent=2).encode()))
+        return name
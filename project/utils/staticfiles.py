@@ -0,0 +1,423 @@
+"""Static file collection and serving without a separate web server
+
+IncrementalManifestStaticFilesStorage post-processes like
+ManifestStaticFilesStorage, but in a thread pool, and only rewrites CSS files
+whose content or referenced files changed since the last collectstatic.
+
+CompressedManifestStaticFilesStorage also saves gzip and, when the ``brotli``
+package is installed, brotli compressed copies of the hashed files. It keeps
+track of the files it compressed, so the next run only compresses new ones.
+
+Every file is written to a temporary name and then renamed into place, so an
+interrupted collectstatic never leaves a partial file behind that the next
+run would take as done.
+
+StaticFilesMiddleware wraps the WSGI application to serve STATIC_ROOT at
+STATIC_URL, picking the smallest variant the client accepts. Hashed names
+never change content, so they are cached for a year as immutable. Files are
+sent with the server's wsgi.file_wrapper, which lets servers like gunicorn
+use sendfile(). project.wsgi wraps itself in it when SERVE_STATIC is set.
+"""
+
+import gzip
+import json
+import mimetypes
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import FileWrapper
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import (
+    ManifestStaticFilesStorage, staticfiles_storage,
+)
+from django.contrib.staticfiles.utils import matches_patterns
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.handlers.wsgi import get_path_info
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = (
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico',
+    '.eot', '.otf', '.ttf',
+)
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Unhashed names can change with the next deploy
+MUTABLE = 'public, max-age=60'
+
+BLOCK_SIZE = 64 * 1024
+
+mimetypes.add_type('application/json', '.map')
+
+
+def write_file(path, content, mode=None):
+    """
+    Writes ``content``, bytes or a file object, to ``path`` through a
+    temporary file in the same directory, so ``path`` is either the old file
+    or the complete new one.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}-{threading.get_ident()}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            if isinstance(content, bytes):
+                f.write(content)
+            else:
+                shutil.copyfileobj(content, f, BLOCK_SIZE)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def compression_extensions():
+    return ['.gz', '.br'] if brotli is not None else ['.gz']
+
+
+def compress(path, mode=None):
+    """
+    Saves compressed copies of the file at ``path`` next to it. Returns
+    {extension: whether it was saved}, as copies that save only a few bytes
+    are left out.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    compressors = {
+        '.gz': lambda: gzip.compress(data, 9, mtime=0),
+        '.br': lambda: brotli.compress(data),
+    }
+    saved = {}
+    for extension in compression_extensions():
+        compressed = compressors[extension]()
+        # Not worth a Content-Encoding for a few bytes
+        saved[extension] = len(compressed) < len(data) * 0.95
+        if saved[extension]:
+            write_file(path + extension, compressed, mode)
+    return saved
+
+
+class RecordingDict(dict):
+    """
+    Remembers the keys looked up with get(), which is how
+    HashedFilesMixin looks up the files a CSS file refers to.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.used = set()
+
+    def get(self, key, default=None):
+        self.used.add(key)
+        return super().get(key, default)
+
+
+class IncrementalManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Hashes, copies and rewrites files in a thread pool. A CSS file is only
+    rewritten when its content or the hashed name of a file it refers to
+    changed since the last run, going by the state file kept next to the
+    manifest. Like the hashed files, both are replaced atomically, so
+    running servers never see them missing or half written.
+    """
+    state_name = 'staticfiles-state.json'
+    state_version = '1'
+
+    def write_atomic(self, name, content):
+        write_file(self.path(name), content, self.file_permissions_mode)
+        return name
+
+    def save_manifest(self):
+        payload = {'paths': self.hashed_files, 'version': self.manifest_version}
+        self.write_atomic(self.manifest_name, json.dumps(payload).encode())
+
+    def read_state(self):
+        try:
+            with open(self.path(self.state_name)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get('version') != self.state_version:
+            return {}
+        return state['files']
+
+    def hash_file(self, paths, adjustable, name):
+        """
+        Returns the name hashed from the file's original content, and
+        whether it was copied there. Adjustable files are copied once
+        rewritten instead.
+        """
+        storage, path = paths[name]
+        with storage.open(path) as original:
+            hashed_name = self.clean_name(self.hashed_name(name, original))
+            if name in adjustable or self.exists(hashed_name):
+                return hashed_name, False
+            original.seek(0)
+            return self.write_atomic(hashed_name, original), True
+
+    def adjust(self, paths, name, original, hashed_files, previous):
+        """
+        Rewrites the file's references to other files with their hashed
+        names. Returns the hashed name of the result, the hashed names it
+        used, whether it was saved and the error if it couldn't be.
+        """
+        if (
+            previous and previous['original'] == original
+            and all(hashed_files.get(key) == value for key, value in previous['uses'].items())
+            and self.exists(previous['hashed'])
+        ):
+            return previous['hashed'], previous['uses'], False, None
+
+        storage, path = paths[name]
+        with storage.open(path) as f:
+            content = f.read().decode('utf-8')
+        lookups = RecordingDict(hashed_files)
+        for extension, patterns in self._patterns.items():
+            if matches_patterns(path, (extension,)):
+                for pattern, template in patterns:
+                    converter = self.url_converter(name, lookups, template)
+                    try:
+                        content = pattern.sub(converter, content)
+                    except ValueError as e:
+                        return None, None, False, e
+        uses = {key: hashed_files.get(key) for key in lookups.used}
+
+        data = content.encode()
+        hashed_name = self.clean_name(self.hashed_name(name, ContentFile(data)))
+        # The name is a hash of the content, so an existing file is the same
+        if self.exists(hashed_name):
+            return hashed_name, uses, False, None
+        return self.write_atomic(hashed_name, data), uses, True, None
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+
+        previous = self.read_state()
+        adjustable = {name for name in paths if matches_patterns(name, self._patterns)}
+        keys = {name: self.hash_key(self.clean_name(name)) for name in paths}
+        hashed_files = {}
+        originals = {}
+        processed = set()
+        state = {}
+
+        with ThreadPoolExecutor() as executor:
+            names = sorted(paths)
+            results = executor.map(
+                lambda name: self.hash_file(paths, adjustable, name), names,
+            )
+            for name, (hashed_name, copied) in zip(names, results):
+                originals[name] = hashed_files[keys[name]] = hashed_name
+                if copied:
+                    processed.add(name)
+                # Start from what unchanged CSS files came out as last time,
+                # so nothing referring to them needs another pass
+                entry = previous.get(name)
+                if name in adjustable and entry and entry['original'] == hashed_name:
+                    hashed_files[keys[name]] = entry['hashed']
+
+            # Rewriting a file changes its hashed name, so files referring
+            # to it need rewriting in turn
+            pending = sorted(adjustable)
+            for _ in range(self.max_post_process_passes):
+                if not pending:
+                    break
+                snapshot = dict(hashed_files)
+                results = executor.map(
+                    lambda name: self.adjust(
+                        paths, name, originals[name], snapshot, previous.get(name),
+                    ),
+                    pending,
+                )
+                changed = set()
+                for name, (hashed_name, uses, saved, error) in zip(pending, results):
+                    if error is not None:
+                        yield name, None, error
+                        continue
+                    if saved:
+                        processed.add(name)
+                    if hashed_name != snapshot[keys[name]]:
+                        changed.add(keys[name])
+                    hashed_files[keys[name]] = hashed_name
+                    state[name] = {
+                        'original': originals[name], 'hashed': hashed_name, 'uses': uses,
+                    }
+                pending = [
+                    name for name in sorted(adjustable)
+                    if name in state and changed.intersection(state[name]['uses'])
+                ]
+            if pending:
+                yield 'All', None, RuntimeError('Max post-process passes exceeded.')
+
+        for name in names:
+            yield name, hashed_files[keys[name]], name in processed
+
+        self.hashed_files = hashed_files
+        self.save_manifest()
+        self.write_atomic(self.state_name, json.dumps({
+            'version': self.state_version, 'files': state,
+        }).encode())
+
+
+class CompressedManifestStaticFilesStorage(IncrementalManifestStaticFilesStorage):
+    """
+    Records which compressed copies it tried to save for each hashed name
+    in a second state file, so files that weren't worth compressing aren't
+    compressed again on every run. A file is compressed again when it was
+    rewritten, a copy saved before is missing or, once brotli is installed,
+    it has no brotli copy yet.
+    """
+    compressed_name = 'staticfiles-compressed.json'
+
+    def read_compressed(self):
+        try:
+            with open(self.path(self.compressed_name)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get('version') != self.state_version:
+            return {}
+        return state['files']
+
+    def needs_compressing(self, hashed_name, saved):
+        if saved is None or set(compression_extensions()) - set(saved):
+            return True
+        path = self.path(hashed_name)
+        return not all(
+            os.path.exists(path + extension)
+            for extension, exists in saved.items() if exists
+        )
+
+    def post_process(self, paths, dry_run=False, **options):
+        previous = {} if dry_run else self.read_compressed()
+        compressed = {}
+        to_compress = []
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            yield name, hashed_name, processed
+            if hashed_name and hashed_name.endswith(COMPRESSIBLE):
+                saved = previous.get(hashed_name)
+                if processed or self.needs_compressing(hashed_name, saved):
+                    to_compress.append(hashed_name)
+                else:
+                    compressed[hashed_name] = saved
+        if dry_run:
+            return
+
+        # zlib and brotli release the GIL, so threads compress in parallel
+        with ThreadPoolExecutor() as executor:
+            results = executor.map(
+                lambda name: compress(self.path(name), self.file_permissions_mode),
+                to_compress,
+            )
+            compressed.update(zip(to_compress, results))
+        self.write_atomic(self.compressed_name, json.dumps({
+            'version': self.state_version, 'files': compressed,
+        }).encode())
+
+
+class StaticFile:
+
+    def __init__(self, path, immutable):
+        content_type, _ = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in (
+                'application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+        stat = os.stat(path)
+        self.headers = [
+            ('Content-Type', content_type),
+            ('Cache-Control', IMMUTABLE if immutable else MUTABLE),
+            ('Last-Modified', http_date(stat.st_mtime)),
+        ]
+
+        # (encoding, path, size, etag), best first
+        self.variants = []
+        for encoding, extension in [('br', '.br'), ('gzip', '.gz'), (None, '')]:
+            try:
+                size = os.stat(path + extension).st_size
+            except FileNotFoundError:
+                continue
+            etag = f'"{int(stat.st_mtime):x}-{size:x}"'
+            self.variants.append((encoding, path + extension, size, etag))
+        if len(self.variants) > 1:
+            self.headers.append(('Vary', 'Accept-Encoding'))
+
+    def get_variant(self, accept_encoding):
+        accepted = set()
+        for coding in accept_encoding.split(','):
+            coding, _, params = coding.partition(';')
+            _, _, quality = params.partition('q=')
+            try:
+                if quality and float(quality) == 0:
+                    continue
+            except ValueError:
+                pass
+            accepted.add(coding.strip().lower())
+        for variant in self.variants:
+            if variant[0] is None or variant[0] in accepted:
+                return variant
+
+
+class StaticFilesMiddleware:
+    """
+    Serves GET and HEAD requests for files in STATIC_ROOT. Anything else
+    goes to ``application``.
+    """
+
+    def __init__(self, application):
+        self.application = application
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        # Name to StaticFile. STATIC_ROOT only changes on deploy, which
+        # restarts the process.
+        self.files = {}
+
+    def find(self, name):
+        static = self.files.get(name)
+        if static is None:
+            try:
+                path = safe_join(self.root, name)
+            except SuspiciousFileOperation:
+                return None
+            if not os.path.isfile(path):
+                return None
+            static = self.files[name] = StaticFile(path, name in self.immutable)
+        return static
+
+    def __call__(self, environ, start_response):
+        path = get_path_info(environ)
+        static = None
+        if path.startswith(self.prefix) and environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            static = self.find(path[len(self.prefix):])
+        if static is None:
+            return self.application(environ, start_response)
+
+        encoding, path, size, etag = static.get_variant(
+            environ.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        headers = static.headers + [('ETag', etag)]
+        if encoding is not None:
+            headers.append(('Content-Encoding', encoding))
+
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        if etag in if_none_match or if_none_match.strip() == '*':
+            start_response('304 Not Modified', headers)
+            return []
+
+        headers.append(('Content-Length', str(size)))
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper', FileWrapper)
+        return file_wrapper(open(path, 'rb'), BLOCK_SIZE)
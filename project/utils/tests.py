@@ -0,0 +1,314 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core import mail
+from django.core.files.storage import FileSystemStorage
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, override_settings,
+)
+from django.utils import timezone
+
+from . import invite
+from .log import ThrottledAdminEmailHandler
+from .mail import Deliverer, OutboxBackend, drain
+from .models import OutboxMessage, User
+from .staticfiles import (
+    IncrementalManifestStaticFilesStorage, StaticFilesMiddleware,
+)
+
+
+def build_invite(request, user, site=None):
+    # The invite templates and urls are left to the project
+    return EmailMessage('Invite', '', to=[user.email])
+
+
+@mock.patch.object(invite, 'build_invite', build_invite)
+class InviteUsersTests(TestCase):
+
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.request._messages = FallbackStorage(self.request)
+
+    def test_new_users(self):
+        User.objects.create_user('gimli@example.com')
+        users = invite.invite_users(self.request, [
+            'Gimli@example.com', 'legolas@example.com', 'LEGOLAS@example.com',
+        ])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            {email: user.username for email, user in users.items()},
+            {
+                'Gimli@example.com': 'gimli@example.com-2',
+                'legolas@example.com': 'legolas@example.com',
+                'LEGOLAS@example.com': 'legolas@example.com',
+            },
+        )
+
+    @mock.patch.object(User, 'is_setup', return_value=True, create=True)
+    def test_existing_users_match_case_insensitively(self, is_setup):
+        user = User.objects.create_user('gimli', email='Gimli@example.com')
+        users = invite.invite_users(self.request, ['gimli@EXAMPLE.com'])
+        self.assertEqual(users, {'gimli@EXAMPLE.com': user})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(User.objects.count(), 1)
+
+
+@override_settings(
+    OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_RETRY_DELAY=60,
+    OUTBOX_MAX_ATTEMPTS=2,
+)
+class DrainTests(TestCase):
+    """
+    The outbox delivers with the locmem backend standing in for SMTP.
+    """
+
+    def setUp(self):
+        OutboxBackend().send_messages([
+            EmailMessage('Session zero', 'Bring dice', to=['gimli@example.com']),
+        ])
+        self.deliverer = Deliverer(1)
+        self.addCleanup(self.deliverer.close)
+
+    def drain_and_skip_delay(self):
+        result = drain(self.deliverer)
+        # Make the message due again, unless it's sent or failed
+        OutboxMessage.objects.update(send_after=timezone.now())
+        return result
+
+    def test_sent(self):
+        self.assertEqual(self.drain_and_skip_delay(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Session zero')
+        message = OutboxMessage.objects.get()
+        self.assertIsNotNone(message.sent)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(self.drain_and_skip_delay(), (0, 0))
+
+    def test_retried_with_backoff(self):
+        with mock.patch.object(
+            EmailBackend, 'send_messages',
+            side_effect=SMTPException('Try again later'),
+        ):
+            start = timezone.now()
+            self.assertEqual(drain(self.deliverer), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.last_error, 'SMTPException: Try again later')
+        self.assertFalse(message.failed)
+        self.assertGreaterEqual(message.send_after, start + timedelta(seconds=60))
+        self.assertLess(message.send_after, start + timedelta(seconds=70))
+        # Not due until the retry delay has passed
+        self.assertEqual(drain(self.deliverer), (0, 0))
+
+        OutboxMessage.objects.update(send_after=timezone.now())
+        self.assertEqual(self.drain_and_skip_delay(), (1, 0))
+        self.assertEqual(OutboxMessage.objects.get().last_error, '')
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_failed_after_max_attempts(self):
+        with mock.patch.object(
+            EmailBackend, 'send_messages',
+            side_effect=SMTPException('Mailbox unavailable'),
+        ):
+            self.assertEqual(self.drain_and_skip_delay(), (0, 1))
+            self.assertFalse(OutboxMessage.objects.get().failed)
+            self.assertEqual(self.drain_and_skip_delay(), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertTrue(message.failed)
+        self.assertEqual(message.attempts, 2)
+        self.assertEqual(self.drain_and_skip_delay(), (0, 0))
+
+    def test_claimed_before_delivery(self):
+        deliverer = mock.Mock()
+        deliverer.map.side_effect = lambda messages: [
+            'Not claimed' if OutboxMessage.objects.due().exists() else None
+            for message in messages
+        ]
+        self.assertEqual(drain(deliverer), (1, 0))
+        self.assertEqual(OutboxMessage.objects.get().attempts, 1)
+
+
+def error_record(error):
+    try:
+        raise error
+    except Exception:
+        exc_info = sys.exc_info()
+    return logging.LogRecord(
+        'django.request', logging.ERROR, __file__, 0, 'Internal Server Error',
+        (), exc_info,
+    )
+
+
+@override_settings(ADMINS=[('Admin', 'admin@example.com')])
+class ThrottledAdminEmailHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.handler = ThrottledAdminEmailHandler(interval=300)
+        self.now = 1000
+        patcher = mock.patch('project.utils.log.time.monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeats_held_back(self):
+        for _ in range(3):
+            self.handler.handle(error_record(KeyError('spell')))
+        self.handler.handle(error_record(ValueError('dice')))
+        self.assertEqual(len(mail.outbox), 2)
+
+        self.now += 301
+        self.handler.handle(error_record(KeyError('spell')))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('(+2 similar)', mail.outbox[2].subject)
+
+    def test_held_back_summarized_on_close(self):
+        for _ in range(3):
+            self.handler.handle(error_record(KeyError('spell')))
+        self.handler.close()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('2 errors were not mailed individually', mail.outbox[1].subject)
+
+
+class StaticFilesMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for extension, content in [('', b'body {}' * 10), ('.gz', b'gz'), ('.br', b'b')]:
+            with open(os.path.join(self.root, 'app.css' + extension), 'wb') as f:
+                f.write(content)
+        with override_settings(STATIC_URL='/static/', STATIC_ROOT=self.root):
+            self.middleware = StaticFilesMiddleware(self.application)
+
+    def application(self, environ, start_response):
+        start_response('404 Not Found', [])
+        return [b'application']
+
+    def get(self, path='/static/app.css', method='GET', **headers):
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        environ = RequestFactory().generic(method, path, **headers).environ
+        body = self.middleware(environ, start_response)
+        response['body'] = b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return response
+
+    def test_accept_encoding(self):
+        for accept_encoding, encoding, body in [
+            ('', None, b'body {}' * 10),
+            ('gzip, deflate', 'gzip', b'gz'),
+            ('gzip, br', 'br', b'b'),
+            ('GZIP;q=0.5, br;q=0', 'gzip', b'gz'),
+            ('br;q=0, gzip;q=0.0', None, b'body {}' * 10),
+        ]:
+            with self.subTest(accept_encoding):
+                response = self.get(HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertEqual(response['status'], '200 OK')
+                self.assertEqual(response['headers'].get('Content-Encoding'), encoding)
+                self.assertEqual(response['headers']['Content-Length'], str(len(body)))
+                self.assertEqual(response['headers']['Vary'], 'Accept-Encoding')
+                self.assertEqual(response['body'], body)
+
+    def test_not_modified(self):
+        etag = self.get(HTTP_ACCEPT_ENCODING='gzip')['headers']['ETag']
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['status'], '304 Not Modified')
+        self.assertEqual(response['body'], b'')
+        self.assertEqual(response['headers']['Content-Encoding'], 'gzip')
+
+        # Each variant has its own ETag
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response['status'], '200 OK')
+        response = self.get(HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response['status'], '304 Not Modified')
+
+    def test_passed_on(self):
+        for path, method in [
+            ('/static/app.css', 'POST'),
+            ('/static/missing.css', 'GET'),
+            ('/static/../app.css', 'GET'),
+            ('/app.css', 'GET'),
+        ]:
+            with self.subTest(path=path, method=method):
+                response = self.get(path, method)
+                self.assertEqual(response['status'], '404 Not Found')
+                self.assertEqual(response['body'], b'application')
+
+
+class IncrementalManifestStaticFilesStorageTests(SimpleTestCase):
+    """
+    collectstatic only reprocesses changed files and the CSS files referring
+    to them, directly or not.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.source = FileSystemStorage(os.path.join(self.root, 'source'))
+        self.write('img/logo.png', b'logo')
+        self.write('css/base.css', b'h1 { background: url("../img/logo.png"); }')
+        self.write('css/app.css', b'@import url("base.css");')
+        self.write('css/print.css', b'body { color: black; }')
+
+    def write(self, name, content):
+        path = self.source.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def collect(self):
+        """
+        Returns the storage and the names it processed.
+        """
+        storage = IncrementalManifestStaticFilesStorage(
+            location=os.path.join(self.root, 'static'), base_url='/static/',
+        )
+        paths = {
+            name: (self.source, name)
+            for name in ['img/logo.png', 'css/base.css', 'css/app.css', 'css/print.css']
+        }
+        processed = set()
+        for name, hashed_name, done in storage.post_process(paths):
+            if isinstance(done, Exception):
+                raise done
+            if done:
+                processed.add(name)
+        return storage, processed
+
+    def read(self, storage, name):
+        with storage.open(storage.hashed_files[name]) as f:
+            return f.read().decode()
+
+    def test_only_changes_reprocessed(self):
+        _, processed = self.collect()
+        self.assertEqual(len(processed), 4)
+        with mock.patch.object(self.source, 'open', wraps=self.source.open) as opened:
+            _, processed = self.collect()
+        self.assertEqual(processed, set())
+        # Read once for hashing, but none are rewritten
+        self.assertEqual(opened.call_count, 4)
+
+        self.write('img/logo.png', b'new logo')
+        storage, processed = self.collect()
+        self.assertEqual(processed, {'img/logo.png', 'css/base.css', 'css/app.css'})
+        self.assertIn(storage.hashed_files['img/logo.png'].split('/')[-1], self.read(storage, 'css/base.css'))
+        self.assertIn(storage.hashed_files['css/base.css'].split('/')[-1], self.read(storage, 'css/app.css'))
+
+        self.write('css/print.css', b'body { color: gray; }')
+        _, processed = self.collect()
+        self.assertEqual(processed, {'css/print.css'})
@@ -6,18 +6,19 @@ from .utils import forms
 
 class AuthenticationForm(forms.HorizontalForm, auth_forms.AuthenticationForm):
     template_name = 'registration/auth/forms/login.html'
+    cache_unbound = True
 
 
 class PasswordChangeForm(forms.BlockForm, auth_forms.PasswordChangeForm):
-    pass
+    cache_unbound = True
 
 
 class PasswordResetForm(forms.BlockForm, auth_forms.PasswordResetForm):
-    pass
+    cache_unbound = True
 
 
 class SetPasswordForm(forms.BlockForm, auth_forms.SetPasswordForm):
-    pass
+    cache_unbound = True
 
 
 class LoginView(auth_views.LoginView):
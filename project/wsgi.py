@@ -2,6 +2,8 @@
 WSGI config
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+With SERVE_STATIC set, it serves the static files itself, see
+project.utils.staticfiles.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/1.10/howto/deployment/wsgi/
@@ -18,3 +20,9 @@ if os.path.exists(envfile):
     Env.read_env(envfile)
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if getattr(settings, 'SERVE_STATIC', False):
+    from project.utils.staticfiles import StaticFilesMiddleware
+    application = StaticFilesMiddleware(application)